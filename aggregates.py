@@ -0,0 +1,86 @@
+import pandas as pd
+from .instrumentation import timed
+
+AGG_COLUMNS = ['差枚', 'G数', 'スコア']
+_STATS = ['sum', 'count', 'mean']
+
+def _flatten(frame):
+    frame.columns = [f"{col}_{stat}" for col, stat in frame.columns]
+    return frame
+
+CUBE_COLUMNS = ['ホール名', '日付', '機種名', '台番号', '差枚', 'G数']
+
+def partial_cube(frame):
+    # 部分ごと（パーティションごと）の合計・件数。スコアは全体のG数平均が決まるまで 差枚×G数 の合計で持つ
+    values = frame[CUBE_COLUMNS].assign(差枚G数=frame['差枚'] * frame['G数'])
+    sums = ['差枚', 'G数', '差枚G数']
+    grouped = values.groupby(['ホール名', '機種名', '日付'], observed=True)
+    machine_daily = _flatten(grouped[sums].agg(['sum', 'count']))
+    machine_daily['件数'] = grouped.size()
+    return {
+        "machine_daily": machine_daily,
+        "hall": _flatten(values.groupby('ホール名', observed=True)[sums].agg(['sum', 'count'])),
+        "number_counts": values.dropna(subset=['差枚G数']).groupby(['ホール名', '台番号'], observed=True).size(),
+    }
+
+def add_partials(frames):
+    # 部分ごと（out-of-core ではパーティションごと）の合計・件数を足し合わせる
+    frames = list(frames)
+    if len(frames) == 1:
+        return frames[0]
+    combined = pd.concat(frames)
+    return combined.groupby(level=list(range(combined.index.nlevels))).sum()
+
+def _with_means(sums, g_mean):
+    # 合計・件数から平均を作る（スコアの合計は 差枚×G数 の合計 / 全体のG数平均）
+    sums['スコア_sum'] = sums.pop('差枚G数_sum') / g_mean
+    sums['スコア_count'] = sums.pop('差枚G数_count')
+    for col in AGG_COLUMNS:
+        sums[f"{col}_mean"] = sums[f"{col}_sum"] / sums[f"{col}_count"]
+    columns = [f"{col}_{stat}" for col in AGG_COLUMNS for stat in _STATS]
+    return sums[columns + ['件数'] if '件数' in sums.columns else columns]
+
+def combine_cube(partials):
+    # partial_cube の結果を足し合わせて集計を作る（部分の分け方によらず同じ結果になる）
+    partials = list(partials)
+    hall_sums = add_partials([partial["hall"] for partial in partials])
+    g_mean = hall_sums['G数_sum'].sum() / hall_sums['G数_count'].sum()
+    machine_daily = _with_means(add_partials([partial["machine_daily"] for partial in partials]), g_mean)
+    return {
+        "G数_mean": g_mean,
+        "machine_daily": machine_daily,  # (ホール名, 機種名, 日付) ごとの合計・件数・平均
+        "hall": _with_means(hall_sums, g_mean),  # ホール単位（日付欠損の行も含む）
+        "number_counts": add_partials([partial["number_counts"] for partial in partials]),  # (ホール名, 台番号) ごとのスコア有効件数
+    }
+
+@timed("集計キューブの作成")
+def build_cube(frame):
+    # 読み込み1回につき1度だけ作る集計。スコアは分析関数と同じ式（差枚 × G数 / 全体のG数平均）で計算する
+    return combine_cube([partial_cube(frame)])
+
+def machine_trend(cube):
+    # groupby(['ホール名', '日付', '機種名'])['差枚'].mean().reset_index() と同じ形
+    trend = cube["machine_daily"]['差枚_mean'].rename('差枚').reset_index()
+    return trend[['ホール名', '日付', '機種名', '差枚']]
+
+def hall_machine_names(cube, hall_name):
+    machine_daily = cube["machine_daily"]
+    if hall_name not in machine_daily.index.get_level_values('ホール名'):
+        return []
+    return machine_daily.loc[hall_name].index.get_level_values('機種名').unique().tolist()
+
+def machine_daily_series(cube, hall_name, machine_names):
+    # 指定機種（複数可）の日別平均差枚を Prophet 用の (ds, y) で返す。返り値2つ目は元の行数
+    machine_daily = cube["machine_daily"]
+    try:
+        target = machine_daily.loc[hall_name]
+    except KeyError:
+        return pd.DataFrame(columns=['ds', 'y']), 0
+    target = target[target.index.get_level_values('機種名').isin(machine_names)]
+    if len(machine_names) == 1:
+        daily = target['差枚_mean'].droplevel('機種名')
+    else:
+        sums = target.groupby(level='日付')[['差枚_sum', '差枚_count']].sum()
+        daily = sums['差枚_sum'] / sums['差枚_count']
+    grouped = daily.sort_index().rename('y').rename_axis('ds').reset_index()
+    return grouped, int(target['件数'].sum())
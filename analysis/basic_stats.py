@@ -1,22 +1,51 @@
+import itertools
+import numpy as np
+import pandas as pd
+from ..aggregates import add_partials, machine_trend
+from ..loader import get_cube, get_feature_table, scan
+from ..feature_store import HIT_THRESHOLD
+from ..memo import memoized
+from ..instrumentation import timed
 
+WEEKDAY_LABELS = ['月', '火', '水', '木', '金', '土', '日']
+
+def weekday_labels(dates):
+    # 曜日ラベルをカテゴリ型で作る（カテゴリは文字列順なので、groupbyの並びは文字列の曜日と同じ）
+    labels = np.array(WEEKDAY_LABELS + [''])
+    categories = sorted(labels)
+    codes = dates.dt.dayofweek.fillna(len(WEEKDAY_LABELS)).to_numpy(dtype=np.int64)
+    code_map = np.array([categories.index(label) for label in labels])
+    return pd.Series(pd.Categorical.from_codes(code_map[codes], categories=categories), index=dates.index, name='曜日')
+
+def _win_rows(df, columns):
+    # 差枚+1000以上の行だけを集める（out-of-core でも保持するのは該当行の指定列だけ）
+    pieces = [part.loc[part['差枚'] > 1000, columns] for part in scan(df, columns + ['差枚'])]
+    return pieces[0] if len(pieces) == 1 else pd.concat(pieces, ignore_index=True)
+
+def _weekday_win_counts(part):
+    win = (part['差枚'] > 0).rename('勝ち')
+    return win.groupby([part['ホール名'], weekday_labels(part['日付']), part['機種名']], observed=True).agg(['sum', 'count'])
+
+@memoized
+@timed()
 def analyze_by_weekday(df):
-    weekday_labels = ['月', '火', '水', '木', '金', '土', '日']
-    df['曜日'] = df['日付'].dt.dayofweek.map(lambda x: weekday_labels[x] if pd.notnull(x) else '')
-    df['勝ち'] = df['差枚'] > 0
-    stats = df.groupby(['ホール名', '曜日', '機種名'])['勝ち'].mean().reset_index()
+    counts = add_partials(_weekday_win_counts(part) for part in scan(df, ['ホール名', '日付', '機種名', '差枚']))
+    stats = (counts['sum'] / counts['count']).reset_index()
     stats.columns = ['ホール名', '曜日', '機種名', '勝率']
     result = []
-    for hall_name, group in stats.groupby('ホール名'):
+    for hall_name, group in stats.groupby('ホール名', observed=True):
         result.append(f"🏢 ホール名: {hall_name}")
         top10 = group.sort_values('勝率', ascending=False).head(10)
         result.append(top10.to_string(index=False))
         result.append("")
     return "\n".join(result)
 
+@memoized
+@timed()
 def analyze_machine_trend(df):
-    trend = df.groupby(['ホール名', '日付', '機種名'])['差枚'].mean().reset_index()
+    trend = machine_trend(get_cube(df))
     result = []
-    for hall_name, group in trend.groupby('ホール名'):
+    for hall_name, group in trend.groupby('ホール名', observed=True):
         result.append(f"🏢 ホール名: {hall_name}")
         recent_dates = group['日付'].dropna().unique()
         recent_dates = sorted(recent_dates)[-10:]
@@ -29,71 +58,91 @@ def analyze_machine_trend(df):
         result.append("")
     return "\n".join(result)
 
+@memoized
+@timed()
 def perform_analysis(df):
     result = []
-    positive_df = df[df['差枚'] > 1000].copy()
-    positive_df = positive_df.sort_values(['ホール名', '機種名', '台番号', '日付'])
-    positive_df['間隔'] = positive_df.groupby(['ホール名', '機種名', '台番号'])['日付'].diff().dt.days
+    # 差枚+1000以上の日の「前回高設定からの日数」が出現間隔になる（特徴量ストアで台・機種ごとに計算済み）
+    table = get_feature_table(df)
+    positive_df = table.loc[table['差枚最大'] > HIT_THRESHOLD, ['前回高設定からの日数']].reset_index()
+    positive_df = positive_df.rename(columns={'前回高設定からの日数': '間隔'})[['ホール名', '機種名', '台番号', '間隔']]
     positive_df = positive_df[positive_df['間隔'].notna()]
     positive_df = positive_df[positive_df['間隔'] <= 60]
     debug_summary = positive_df['間隔'].describe().to_string()
     result.append("[debug] プラス差枚の出現間隔（日数）:\n" + debug_summary)
-    周期傾向 = positive_df.groupby(['ホール名', '機種名', '台番号'])['間隔'].mean().reset_index()
+    周期傾向 = positive_df.groupby(['ホール名', '機種名', '台番号'], observed=True)['間隔'].mean().reset_index()
     result.append("\n[狙い目候補（周期的に出やすい台）]:")
     result.append(周期傾向.sort_values('間隔').head(10).to_string(index=False))
     return "\n".join(result)
 
+@memoized
+@timed()
 def analyze_high_win_freq(df):
-    win_df = df[df['差枚'] > 1000]
+    # 集計は全ホール分を1回で行い、ホールごとには切り出すだけにする
+    keys = ['ホール名', '機種名', '台番号']
+    counts = add_partials(part[part['差枚'] > 1000].groupby(keys, observed=True).size() for part in scan(df, keys + ['差枚']))
+    freq_all = counts.reset_index(name='出現回数')
     result = []
-    for hall_name, group in win_df.groupby('ホール名'):
+    for hall_name, freq in freq_all.groupby('ホール名', observed=True):
         result.append(f"🏢 ホール名: {hall_name}")
-        freq = group.groupby(['機種名', '台番号']).size().reset_index(name='出現回数')
+        freq = freq.drop(columns='ホール名').reset_index(drop=True)
         top10 = freq.sort_values('出現回数', ascending=False).head(10)
         result.append("[差枚+1000以上 出現頻度トップ10]")
         result.append(top10.to_string(index=False))
         result.append("")
     return "\n".join(result)
 
+def _tail_win_counts(part):
+    numbers = pd.to_numeric(part['台番号'], errors='coerce')
+    win = numbers.notna() & (part['差枚'] > 1000)
+    tails = (numbers[win].astype(int) % 10).rename('末尾')
+    return tails.groupby(part.loc[win, 'ホール名'], observed=True).value_counts()
+
+@memoized
+@timed()
 def analyze_tail_numbers(df):
-    df['台番号'] = pd.to_numeric(df['台番号'], errors='coerce')
-    df = df[df['台番号'].notna()]
-    df['末尾'] = df['台番号'].astype(int) % 10
-    win_df = df[df['差枚'] > 1000]
+    tail_counts_all = add_partials(_tail_win_counts(part) for part in scan(df, ['ホール名', '台番号', '差枚'])).sort_index()
     result = []
-    for hall_name, group in win_df.groupby('ホール名'):
+    for hall_name, tail_counts in tail_counts_all.groupby(level=0, observed=True):
         result.append(f"🏢 ホール名: {hall_name}")
-        tail_counts = group['末尾'].value_counts().sort_index()
+        tail_counts = tail_counts.droplevel(0)
         result.append("🔢 末尾別 +1000枚 出現回数:")
         result.append(tail_counts.to_string())
         result.append("")
     return "\n".join(result)
 
+def find_consecutive_runs(df, keys, min_length=3):
+    # keysごとに台番号を並べ、+1ずつ続く並びを全グループ一括で検出する（diff/cumsum方式）
+    # 返り値は keys・開始・長さ の DataFrame（keys→開始の順）
+    numbers = pd.to_numeric(df['台番号'], errors='coerce')
+    target = df.loc[numbers.notna(), keys].assign(台番号=numbers[numbers.notna()].astype(int))
+    target = target.dropna(subset=keys).sort_values(keys + ['台番号'])
+    if target.empty:
+        return pd.DataFrame(columns=keys + ['開始', '長さ'])
+
+    group_ids = target.groupby(keys, sort=False, observed=True).ngroup().to_numpy()
+    values = target['台番号'].to_numpy()
+    run_start = np.ones(len(values), dtype=bool)
+    run_start[1:] = (group_ids[1:] != group_ids[:-1]) | (values[1:] != values[:-1] + 1)
+    lengths = np.bincount(np.cumsum(run_start) - 1)
+    start_positions = np.flatnonzero(run_start)[lengths >= min_length]
+
+    runs = target.iloc[start_positions][keys].reset_index(drop=True)
+    runs['開始'] = values[start_positions]
+    runs['長さ'] = lengths[lengths >= min_length]
+    return runs
+
+@memoized
+@timed()
 def analyze_consecutive_hits(df):
-    df['台番号'] = pd.to_numeric(df['台番号'], errors='coerce')
-    df = df[df['台番号'].notna()]
-    win_df = df[df['差枚'] > 1000]
+    runs = find_consecutive_runs(_win_rows(df, ['ホール名', '日付', '台番号']), ['ホール名', '日付'])
     result = []
-    for hall_name, group in win_df.groupby(['ホール名', '日付']):
-        hall, date = hall_name
-        group = group.sort_values('台番号')
-        numbers = group['台番号'].astype(int).tolist()
-        streaks = []
-        current_streak = [numbers[0]] if numbers else []
-        for i in range(1, len(numbers)):
-            if numbers[i] == numbers[i - 1] + 1:
-                current_streak.append(numbers[i])
-            else:
-                if len(current_streak) >= 3:
-                    streaks.append(current_streak[:])
-                current_streak = [numbers[i]]
-        if len(current_streak) >= 3:
-            streaks.append(current_streak)
-        if streaks:
-            result.append(f"🏢 {hall} ({date.date()}): 3連番以上の出現")
-            for s in streaks:
-                result.append(f"  → {s}")
-            result.append("")
+    rows = zip(runs['ホール名'], runs['日付'], runs['開始'], runs['長さ'])
+    for (hall, date), streaks in itertools.groupby(rows, key=lambda row: row[:2]):
+        result.append(f"🏢 {hall} ({date.date()}): 3連番以上の出現")
+        for _, _, start, length in streaks:
+            result.append(f"  → {list(range(int(start), int(start) + int(length)))}")
+        result.append("")
     if not result:
         return "3連番以上の出現は確認されませんでした。"
     return "\n".join(result)
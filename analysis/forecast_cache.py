@@ -0,0 +1,74 @@
+import hashlib
+import json
+import os
+import time
+import pandas as pd
+
+CACHE_DIR = "output/cache/forecast"
+CACHE_MAX_ENTRIES = 5000
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+CACHE_MAX_AGE_DAYS = 30
+
+def series_fingerprint(grouped, days, params):
+    # 集計済み (ds, y) 系列・予測日数・モデル設定から予測結果のキーを作る
+    h = hashlib.sha256()
+    h.update(pd.to_datetime(grouped['ds']).to_numpy(dtype='datetime64[ns]').view('int64').tobytes())
+    h.update(grouped['y'].to_numpy(dtype='float64').tobytes())
+    h.update(json.dumps({"days": int(days), "params": params}, sort_keys=True, default=str).encode("utf-8"))
+    return h.hexdigest()
+
+def _paths(key):
+    return os.path.join(CACHE_DIR, f"{key}.csv"), os.path.join(CACHE_DIR, f"{key}.json")
+
+def load_forecast(key):
+    csv_path, _ = _paths(key)
+    try:
+        forecast = pd.read_csv(csv_path, parse_dates=["ds"])
+    except (FileNotFoundError, ValueError, pd.errors.ParserError):
+        return None
+    # 最終利用時刻として更新し、削除は古く使われていないものから行う
+    os.utime(csv_path)
+    return forecast
+
+def save_forecast(key, forecast, model_json=None):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    csv_path, json_path = _paths(key)
+    # 並列ワーカーから同時に書かれても壊れないよう一時ファイル経由で置き換える
+    suffix = f".{os.getpid()}.tmp"
+    if model_json is not None:
+        with open(json_path + suffix, "w", encoding="utf-8") as f:
+            f.write(model_json)
+        os.replace(json_path + suffix, json_path)
+    forecast.to_csv(csv_path + suffix, index=False)
+    os.replace(csv_path + suffix, csv_path)
+
+def evict_forecast_cache(max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES, max_age_days=CACHE_MAX_AGE_DAYS):
+    if not os.path.isdir(CACHE_DIR):
+        return 0
+
+    entries = []
+    for name in os.listdir(CACHE_DIR):
+        if not name.endswith(".csv"):
+            continue
+        key = name[:-len(".csv")]
+        csv_path, json_path = _paths(key)
+        try:
+            stat = os.stat(csv_path)
+        except FileNotFoundError:
+            continue
+        size = stat.st_size + (os.path.getsize(json_path) if os.path.exists(json_path) else 0)
+        entries.append((stat.st_mtime, size, key))
+
+    entries.sort(reverse=True)
+    cutoff = time.time() - max_age_days * 86400
+    total_bytes = 0
+    removed = 0
+    for count, (mtime, size, key) in enumerate(entries, start=1):
+        total_bytes += size
+        if mtime >= cutoff and count <= max_entries and total_bytes <= max_bytes:
+            continue
+        for path in _paths(key):
+            if os.path.exists(path):
+                os.remove(path)
+        removed += 1
+    return removed
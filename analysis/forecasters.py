@@ -0,0 +1,104 @@
+import functools
+import importlib.metadata
+import json
+from statistics import NormalDist
+import numpy as np
+import pandas as pd
+
+# 予測モデルの差し替え口。各モデルは (ds, y) 系列のリストを受け取り、
+# 系列ごとに (ds/yhat/yhat_lower/yhat_upper の予測, 保存用のモデル情報JSON) を返す fit_many を持つ。
+# vectorized=True のモデルは全機種をまとめて1回で学習できるため、一括予測では事前にまとめて学習する
+# params は予測キャッシュのキーに含める設定（Prophetは既存キャッシュとの互換のため名前を含めない）
+FORECAST_COLUMNS = ["ds", "yhat", "yhat_lower", "yhat_upper"]
+PROPHET_PARAMS = {"daily_seasonality": True}
+# 直近window日の 切片 + 線形トレンド + 曜日効果 をリッジ回帰で当てはめる
+WEEKDAY_TREND_PARAMS = {"window": 56, "trend_alpha": 10.0, "weekday_alpha": 1.0, "interval_width": 0.8}
+DEFAULT_FORECASTER = "prophet"
+
+@functools.lru_cache(maxsize=None)
+def prophet_version():
+    # キャッシュ命中時にProphet本体（cmdstanpy込み）を読み込まずに済むよう、配布情報から取得する
+    try:
+        return importlib.metadata.version("prophet")
+    except importlib.metadata.PackageNotFoundError:
+        from prophet import __version__
+        return __version__
+
+def _fit_prophet(grouped, days):
+    from prophet import Prophet
+    from prophet.serialize import model_to_json
+
+    model = Prophet(**PROPHET_PARAMS)
+    model.fit(grouped)
+
+    future = model.make_future_dataframe(periods=days)
+    forecast = model.predict(future)[FORECAST_COLUMNS]
+    return forecast, model_to_json(model)
+
+def fit_prophet_many(series, days):
+    return [_fit_prophet(grouped, days) for grouped in series]
+
+def _weekday_trend_features(day_numbers, last_days):
+    # 列: 切片, トレンド（最終日からの経過日数/30）, 曜日ダミー7列（1970-01-01は木曜）
+    trend = (day_numbers - last_days[:, None]) / 30.0
+    weekday = (day_numbers + 3) % 7
+    dummies = (weekday[..., None] == np.arange(7)).astype(float)
+    return np.concatenate([np.ones_like(trend)[..., None], trend[..., None], dummies], axis=-1)
+
+def _padded(arrays, dtype, fill):
+    out = np.full((len(arrays), max((len(a) for a in arrays), default=0)), fill, dtype=dtype)
+    for i, values in enumerate(arrays):
+        out[i, :len(values)] = values
+    return out
+
+def fit_weekday_trend_many(series, days, params=WEEKDAY_TREND_PARAMS):
+    if not series:
+        return []
+
+    # 系列ごとの日付（1970-01-01からの日数）と値。欠損値はProphetと同じく学習から除く
+    history_days, values = [], []
+    for grouped in series:
+        valid = grouped['y'].notna().to_numpy()
+        ds = grouped['ds'] if pd.api.types.is_datetime64_any_dtype(grouped['ds']) else pd.to_datetime(grouped['ds'])
+        history_days.append(ds.to_numpy(dtype='datetime64[D]').astype(np.int64)[valid])
+        values.append(grouped['y'].to_numpy(dtype=float)[valid])
+    last_days = np.array([d.max() for d in history_days], dtype=np.int64)
+
+    # 全系列を (系列数, 日数) に揃え、マスク付きの正規方程式を系列数ぶん一度に解く
+    day_numbers = _padded(history_days, np.int64, 0)
+    y = _padded(values, float, 0.0)
+    mask = _padded([np.ones(len(d), dtype=bool) for d in history_days], bool, False)
+    mask &= day_numbers > (last_days - params["window"])[:, None]
+    X = _weekday_trend_features(day_numbers, last_days) * mask[..., None]
+    penalty = np.diag([1e-6, params["trend_alpha"]] + [params["weekday_alpha"]] * 7)
+    A = np.einsum('nlp,nlq->npq', X, X) + penalty
+    b = np.einsum('nlp,nl->np', X, y * mask)
+    coef = np.linalg.solve(A, b[..., None])[..., 0]
+
+    residuals = (y - np.einsum('nlp,np->nl', X, coef)) * mask
+    counts = mask.sum(axis=1)
+    sigma = np.sqrt((residuals ** 2).sum(axis=1) / np.maximum(counts - X.shape[-1], 1))
+    z = NormalDist().inv_cdf(0.5 + params["interval_width"] / 2)
+
+    # 出力はProphetの make_future_dataframe と同じく 学習に使った全日付 + 予測日数
+    future = np.arange(1, days + 1)
+    output_days = _padded([np.concatenate([d, last + future]) for d, last in zip(history_days, last_days)], np.int64, 0)
+    yhat = np.einsum('nlp,np->nl', _weekday_trend_features(output_days, last_days), coef)
+
+    results = []
+    for i, history in enumerate(history_days):
+        n = len(history) + days
+        forecast = pd.DataFrame({
+            "ds": output_days[i, :n].astype('datetime64[D]').astype('datetime64[ns]'),
+            "yhat": yhat[i, :n],
+            "yhat_lower": yhat[i, :n] - z * sigma[i],
+            "yhat_upper": yhat[i, :n] + z * sigma[i],
+        })
+        model_json = json.dumps({"coef": coef[i].tolist(), "sigma": float(sigma[i]), "params": params})
+        results.append((forecast, model_json))
+    return results
+
+FORECASTERS = {
+    "prophet": {"fit_many": fit_prophet_many, "params": lambda: {**PROPHET_PARAMS, "prophet": prophet_version()}, "vectorized": False},
+    "weekday_trend": {"fit_many": fit_weekday_trend_many, "params": lambda: {**WEEKDAY_TREND_PARAMS, "forecaster": "weekday_trend"}, "vectorized": True},
+}
@@ -1,37 +1,72 @@
 
 import pandas as pd
-import matplotlib.pyplot as plt
-from prophet import Prophet
-import io
-from PIL import Image
+import multiprocessing
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
-from ..utils import get_japanese_font, sanitize_filename
+from queue import Empty
+from ..utils import sanitize_filename
+from ..aggregates import hall_machine_names, machine_daily_series
+from ..loader import get_cube, hall_names, latest_rows
+from ..instrumentation import collect, span, count, call_collected, merge, summary
+from .forecast_cache import series_fingerprint, load_forecast, save_forecast, evict_forecast_cache
+from .rendering import draw_forecast, to_image, render_forecast_png
+from .forecasters import FORECASTERS, FORECAST_COLUMNS, DEFAULT_FORECASTER
 
-jp_font = get_japanese_font()
-
-def forecast_machine_with_prophet(df, machine_name, days=7):
-    df['日付'] = pd.to_datetime(df['日付'])
-    target = df[df['機種名'].str.startswith(machine_name)]
-    if target.empty:
-        return f"❌ 機種「{machine_name}」のデータが存在しません。"
-
-    hall_name = target['ホール名'].iloc[0]
-    grouped = (
-        target.groupby('日付')['差枚']
+def aggregate_daily(target):
+    return (
+        target.groupby(pd.to_datetime(target['日付']))['差枚']
         .mean()
         .reset_index()
         .rename(columns={'日付': 'ds', '差枚': 'y'})
     )
 
+def fit_forecasts(series, days, forecaster=DEFAULT_FORECASTER):
+    # 同じ系列・設定の予測が保存済みなら学習を省略し、残りの系列だけをまとめて学習する
+    backend = FORECASTERS[forecaster]
+    params = backend["params"]()
+    with span("予測キャッシュの確認"):
+        keys = [series_fingerprint(grouped, days, params) for grouped in series]
+        forecasts = [load_forecast(key) for key in keys]
+    missing = [i for i, forecast in enumerate(forecasts) if forecast is None]
+    count("series", len(series))
+    count("cached_series", len(series) - len(missing))
+    if not missing:
+        return forecasts
+    with span(f"学習（{forecaster}）"):
+        fitted = backend["fit_many"]([series[i] for i in missing], days)
+    with span("予測キャッシュの保存"):
+        for i, (forecast, model_json) in zip(missing, fitted):
+            save_forecast(keys[i], forecast, model_json)
+            forecasts[i] = forecast
+    return forecasts
+
+def fit_forecast(grouped, days, forecaster=DEFAULT_FORECASTER):
+    return fit_forecasts([grouped], days, forecaster)[0]
+
+def forecast_machine_with_prophet(df, machine_name, days=7, hall_name=None, forecaster=DEFAULT_FORECASTER):
+    if hall_name is not None:
+        # ホール指定時は読み込み時の集計から日別平均を取り出す
+        cube = get_cube(df)
+        machines = [name for name in hall_machine_names(cube, hall_name) if str(name).startswith(machine_name)]
+        if not machines:
+            return f"❌ 機種「{machine_name}」のデータが存在しません。"
+        grouped, _ = machine_daily_series(cube, hall_name, machines)
+    else:
+        target = df[df['機種名'].str.startswith(machine_name)]
+        if target.empty:
+            return f"❌ 機種「{machine_name}」のデータが存在しません。"
+
+        hall_name = target['ホール名'].iloc[0]
+        grouped = aggregate_daily(target)
+
     if len(grouped) < 10:
         return f"⚠️ 機種「{machine_name}」の履歴が少なすぎます（{len(grouped)}件）"
 
-    model = Prophet(daily_seasonality=True)
-    model.fit(grouped)
-
-    future = model.make_future_dataframe(periods=days)
-    forecast = model.predict(future)
+    forecast = fit_forecast(grouped, days, forecaster)
+    evict_forecast_cache()
 
     today = datetime.today().strftime("%Y-%m-%d")
     safe_hall = sanitize_filename(hall_name)
@@ -39,106 +74,103 @@ def forecast_machine_with_prophet(df, machine_name, days=7):
     output_dir = f"output/{safe_hall}/{safe_machine}"
     os.makedirs(output_dir, exist_ok=True)
 
-    fig, ax = plt.subplots(figsize=(10, 4))
-    ax.plot(grouped['ds'], grouped['y'], label="実績", linewidth=2)
-    ax.plot(forecast['ds'], forecast['yhat'], label="予測", linestyle="--")
-    ax.fill_between(forecast['ds'], forecast['yhat_lower'], forecast['yhat_upper'], color="gray", alpha=0.3)
-    ax.set_title(f"{machine_name} 差枚予測（{days}日先）", fontproperties=jp_font)
-    ax.set_ylabel("平均差枚", fontproperties=jp_font)
-    ax.set_xlabel("日付", fontproperties=jp_font)
-    ax.legend(prop=jp_font)
-    ax.grid(True)
-    plt.tight_layout()
-
+    # 1回の描画結果をそのまま画面用の画像にし、同じ画像をPNGとして保存する
+    image = to_image(draw_forecast(grouped, forecast, f"{machine_name} 差枚予測（{days}日先）"))
     png_path = os.path.join(output_dir, f"{today}.png")
     csv_path = os.path.join(output_dir, f"{today}.csv")
-    plt.savefig(png_path)
-    forecast[["ds", "yhat", "yhat_lower", "yhat_upper"]].to_csv(csv_path, index=False)
-    plt.close(fig)
+    with span("PNG保存"):
+        image.save(png_path)
+    with span("予測CSVの保存"):
+        forecast[FORECAST_COLUMNS].to_csv(csv_path, index=False)
+    return image
 
-    buf = io.BytesIO()
-    with open(png_path, "rb") as f:
-        buf.write(f.read())
-    buf.seek(0)
-    return Image.open(buf).convert("RGB")
+BATCH_OUTPUT_ROOT = "../output"
+BATCH_JOB_TIMEOUT = 600  # 1ジョブあたりの上限秒数
+RENDER_WORKERS = min(4, os.cpu_count() or 1)  # 逐次実行時にPNGを描画するプロセス数
+_POLL_INTERVAL = 1.0
+_started_queue = None  # ワーカープロセスでのみ設定する（実行開始の通知先）
 
-def batch_forecast_for_hall(df, hall_name, days=7, force=False):
-    results = []
-    today = datetime.today().strftime("%Y-%m-%d")
-    df['日付'] = pd.to_datetime(df['日付'])
-    hall_df = df[df['ホール名'] == hall_name]
-    latest_date = hall_df['日付'].max()
-    filtered = hall_df[hall_df['日付'] == latest_date]
+def prepare_hall_jobs(df, hall_name):
+    # ホール内の機種ごとに日別平均へ集計済みの系列を切り出す（ワーカーにはこれだけを渡す）
+    filtered = latest_rows(df, hall_name)
 
-    grouped = filtered.groupby("機種名")["台番号"].nunique().reset_index(name="台数")
+    grouped = filtered.groupby("機種名", observed=True)["台番号"].nunique().reset_index(name="台数")
     machines = grouped.sort_values("台数", ascending=False)["機種名"].tolist()
 
+    cube = get_cube(df)
+    jobs = []
     for machine_name in machines:
-        target = hall_df[hall_df['機種名'] == machine_name]
-        if len(target) < 10:
+        grouped_data, rows = machine_daily_series(cube, hall_name, [machine_name])
+        if rows < 10:
             continue
 
-        grouped_data = (
-            target.groupby('日付')['差枚']
-            .mean()
-            .reset_index()
-            .rename(columns={'日付': 'ds', '差枚': 'y'})
-        )
-
         if len(grouped_data) < 10:
             continue
+        jobs.append((hall_name, machine_name, grouped_data))
+    return jobs
+
+def _artifact_paths(hall_name, machine_name, today):
+    output_dir = f"{BATCH_OUTPUT_ROOT}/{sanitize_filename(hall_name)}/{sanitize_filename(machine_name)}"
+    return output_dir, os.path.join(output_dir, f"{today}.png"), os.path.join(output_dir, f"{today}.csv")
+
+def _artifacts_exist(hall_name, machine_name, today, png=True):
+    _, png_path, csv_path = _artifact_paths(hall_name, machine_name, today)
+    return os.path.exists(csv_path) and (not png or os.path.exists(png_path))
 
+def prefit_jobs(jobs, days, today, force=False, png=True, forecaster=DEFAULT_FORECASTER):
+    # 全機種をまとめて学習できるモデルなら、未処理のジョブを事前に1回で学習して {(ホール名, 機種名): 予測} を返す
+    if not FORECASTERS[forecaster]["vectorized"]:
+        return {}
+    pending = [job for job in jobs if force or not _artifacts_exist(job[0], job[1], today, png)]
+    forecasts = fit_forecasts([grouped_data for _, _, grouped_data in pending], days, forecaster)
+    return {(hall_name, machine_name): forecast for (hall_name, machine_name, _), forecast in zip(pending, forecasts)}
+
+def run_forecast_job(hall_name, machine_name, grouped_data, days, today, force=False, png=True, render=render_forecast_png, forecaster=DEFAULT_FORECASTER, forecast=None):
+    # 1機種分の学習・予測・保存。スキップ時はNoneを返す
+    # png=False ならCSVだけを保存する。renderを差し替えるとPNGの描画を別プロセスへ回せる
+    # forecastを渡した場合（prefit_jobs で学習済み）は学習を省略する
+    output_dir, png_path, csv_path = _artifact_paths(hall_name, machine_name, today)
+
+    # 予測済みチェック
+    if not force and _artifacts_exist(hall_name, machine_name, today, png):
+        return None
+
+    os.makedirs(output_dir, exist_ok=True)
+    if forecast is None:
+        forecast = fit_forecast(grouped_data, days, forecaster)
+    with span("予測CSVの保存"):
+        forecast[FORECAST_COLUMNS].to_csv(csv_path, index=False)
+    if png:
+        render(png_path, grouped_data, forecast, f"{machine_name} 差枚予測")
+
+    return f"✅ {machine_name} - 予測完了"
+
+def _iter_job_results(jobs, days, today, force, png=True, render=render_forecast_png, forecaster=DEFAULT_FORECASTER, forecasts=None):
+    forecasts = forecasts or {}
+    for hall_name, machine_name, grouped_data in jobs:
         try:
-            model = Prophet(daily_seasonality=True)
-            model.fit(grouped_data)
-
-            future = model.make_future_dataframe(periods=days)
-            forecast = model.predict(future)
-
-            safe_hall = sanitize_filename(hall_name)
-            safe_machine = sanitize_filename(machine_name)
-            output_dir = f"../output/{safe_hall}/{safe_machine}"
-            os.makedirs(output_dir, exist_ok=True)
-            png_path = os.path.join(output_dir, f"{today}.png")
-            csv_path = os.path.join(output_dir, f"{today}.csv")
-
-            # 予測済みチェック
-            if not force and os.path.exists(png_path) and os.path.exists(csv_path):
-                # results.append(f"⏭ {machine_name} - スキップ（既に予測済み）")
-                continue
-
-            fig, ax = plt.subplots(figsize=(10, 4))
-            ax.plot(grouped_data['ds'], grouped_data['y'], label="実績", linewidth=2)
-            ax.plot(forecast['ds'], forecast['yhat'], label="予測", linestyle="--")
-            ax.fill_between(forecast['ds'], forecast['yhat_lower'], forecast['yhat_upper'], color="gray", alpha=0.3)
-            ax.set_title(f"{machine_name} 差枚予測", fontproperties=jp_font)
-            ax.set_ylabel("平均差枚", fontproperties=jp_font)
-            ax.set_xlabel("日付", fontproperties=jp_font)
-            ax.legend(prop=jp_font)
-            ax.grid(True)
-            plt.tight_layout()
-
-            png_path = os.path.join(output_dir, f"{today}.png")
-            csv_path = os.path.join(output_dir, f"{today}.csv")
-            plt.savefig(png_path)
-            forecast[["ds", "yhat", "yhat_lower", "yhat_upper"]].to_csv(csv_path, index=False)
-            plt.close(fig)
-
-            results.append(f"✅ {machine_name} - 予測完了")
+            yield run_forecast_job(hall_name, machine_name, grouped_data, days, today, force, png, render, forecaster, forecasts.get((hall_name, machine_name)))
 
         except Exception as e:
-            results.append(f"❌ {machine_name} - エラー: {str(e)}")
+            yield f"❌ {machine_name} - エラー: {str(e)}"
 
+def _prefit_or_log(jobs, days, today, force, png, forecaster, logs):
+    # まとめて学習できなかった場合は機種ごとの学習に任せる
+    try:
+        return prefit_jobs(jobs, days, today, force, png, forecaster)
+    except Exception as e:
+        logs.append(f"⚠️ 全機種まとめての学習に失敗したため機種ごとに学習します: {str(e)}")
+        return {}
+
+def batch_forecast_for_hall(df, hall_name, days=7, force=False, forecaster=DEFAULT_FORECASTER):
+    today = datetime.today().strftime("%Y-%m-%d")
+    jobs = prepare_hall_jobs(df, hall_name)
+    results = []
+    forecasts = _prefit_or_log(jobs, days, today, force, True, forecaster, results)
+    results.extend(message for message in _iter_job_results(jobs, days, today, force, forecaster=forecaster, forecasts=forecasts) if message is not None)
     return "\n".join(results)
 
-def batch_forecast_all(df, days=7):
-    halls = df["ホール名"].dropna().unique()
-    logs = []
-    for hall in halls:
-        logs.append(f"🏢 {hall} の予測を開始...")
-        result = batch_forecast_for_hall(df, hall, days)
-        logs.append(result)
-    
+def _write_batch_log(logs):
     # バッチ全体ログ保存
     today = datetime.today().strftime("%Y-%m-%d")
     log_dir = "output/logs"
@@ -147,4 +179,195 @@ def batch_forecast_all(df, days=7):
     with open(log_path, "w", encoding="utf-8") as f:
         f.write("\n".join(logs))
 
-    return "\n".join(logs)
\ No newline at end of file
+def iter_batch_forecast_all(df, days=7, force=False, png=True, render_workers=RENDER_WORKERS, forecaster=DEFAULT_FORECASTER, profile=False):
+    # 逐次実行版の進捗ジェネレーター（1機種ごとにそれまでのログ全文を返す）
+    # 学習はこのプロセスで順に行い、PNGの描画は描画プールで並行して書き出す
+    # 最後に段階ごとの所要時間をログへ追記する（profile=True なら cProfile の結果も保存する）
+    today = datetime.today().strftime("%Y-%m-%d")
+    halls = hall_names(df)
+    logs = []
+    with collect("一括予測", profile) as record:
+        pool = ProcessPoolExecutor(max_workers=render_workers) if png and render_workers > 1 else None
+        renders = {}
+
+        def submit_render(png_path, *args):
+            renders[pool.submit(call_collected, render_forecast_png, png_path, *args)] = png_path
+
+        render = render_forecast_png if pool is None else submit_render
+        with span("ジョブの準備"):
+            hall_jobs = [(hall, prepare_hall_jobs(df, hall)) for hall in halls]
+        forecasts = _prefit_or_log([job for _, jobs in hall_jobs for job in jobs], days, today, force, png, forecaster, logs)
+        try:
+            for hall, jobs in hall_jobs:
+                logs.append(f"🏢 {hall} の予測を開始...")
+                yield "\n".join(logs)
+                for message in _iter_job_results(jobs, days, today, force, png, render, forecaster, forecasts):
+                    if message is not None:
+                        logs.append(message)
+                    yield "\n".join(logs)
+
+            for future in wait(renders).done:
+                if future.exception() is not None:
+                    logs.append(f"❌ {renders[future]} - 描画エラー: {future.exception()}")
+                else:
+                    merge(future.result()[1])
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+
+    logs.append(summary(record))
+    _write_batch_log(logs)
+    evict_forecast_cache()
+    yield "\n".join(logs)
+
+def batch_forecast_all(df, days=7, png=True, forecaster=DEFAULT_FORECASTER, profile=False):
+    logs = ""
+    for logs in iter_batch_forecast_all(df, days, png=png, forecaster=forecaster, profile=profile):
+        pass
+    return logs
+
+def _terminate_pool(executor):
+    executor.shutdown(wait=False, cancel_futures=True)
+    # 固まったワーカーはshutdownでは止まらないため強制終了する
+    for process in list((executor._processes or {}).values()):
+        if process.is_alive():
+            process.terminate()
+
+def _init_worker(started_queue):
+    global _started_queue
+    _started_queue = started_queue
+
+def _run_job_in_worker(index, *args):
+    # ワーカーで実際に実行を始めた時刻を親プロセスへ知らせる（タイムアウトは待ち行列の時間を含めずに測る）
+    _started_queue.put((index, time.time()))
+    return call_collected(run_forecast_job, *args)
+
+def _drain_started(started_queue, started):
+    while True:
+        try:
+            index, started_at = started_queue.get_nowait()
+        except Empty:
+            return
+        started[index] = started_at
+
+def _run_pool(jobs, days, today, force, max_workers, job_timeout, png=True, forecaster=DEFAULT_FORECASTER, forecasts=None):
+    # 1つのプールでjobsを実行し (job, メッセージ) を完了順に返す。
+    # タイムアウトかワーカー異常終了でプールを破棄した場合は (未完了ジョブ, 異常終了に巻き込まれたジョブ) を返す
+    # タイムアウト時は実行中の他のジョブの完了を待ってからプールを破棄し、未着手のジョブだけを再投入する
+    started_queue = multiprocessing.Queue()
+    executor = ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(started_queue,))
+    forecasts = forecasts or {}
+    futures = {}
+    for index, job in enumerate(jobs):
+        hall_name, machine_name, grouped_data = job
+        future = executor.submit(_run_job_in_worker, index, hall_name, machine_name, grouped_data, days, today, force, png, render_forecast_png, forecaster, forecasts.get((hall_name, machine_name)))
+        futures[future] = index
+
+    pending = set(futures)
+    started = {}
+    crashed = []
+    rerun = []
+    restart = False
+    try:
+        while pending:
+            _drain_started(started_queue, started)
+            if restart:
+                # 破棄を決めた後は、実行中のジョブが終わるのを待つだけ（未着手のジョブは取り消す）
+                for future in pending:
+                    if futures[future] not in started:
+                        future.cancel()
+                if not any(futures[future] in started for future in pending):
+                    break
+
+            done, pending = wait(pending, timeout=_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+            _drain_started(started_queue, started)
+            for future in done:
+                job = jobs[futures[future]]
+                if future.cancelled():
+                    rerun.append(job)
+                    continue
+                try:
+                    message, part = future.result()
+                    merge(part)
+                    yield job, message
+                except BrokenProcessPool:
+                    # 実行を始めていたジョブだけを原因候補とし、未着手のジョブはそのまま再投入する
+                    restart = True
+                    (crashed if futures[future] in started else rerun).append(job)
+                except Exception as e:
+                    yield job, f"❌ {job[1]} - エラー: {str(e)}"
+
+            now = time.time()
+            for future in list(pending):
+                index = futures[future]
+                if index in started and now - started[index] > job_timeout:
+                    pending.discard(future)
+                    restart = True
+                    yield jobs[index], f"⏱ {jobs[index][1]} - タイムアウト（{job_timeout}秒）"
+    except GeneratorExit:
+        # 呼び出し側で中断（キャンセル）された場合は実行中のワーカーごと破棄する
+        _terminate_pool(executor)
+        started_queue.close()
+        raise
+
+    if restart:
+        _terminate_pool(executor)
+    else:
+        executor.shutdown()
+    started_queue.close()
+    rerun.extend(jobs[futures[future]] for future in pending)
+    if rerun and not crashed and len(rerun) == len(jobs):
+        # 原因を特定できないまま全件が巻き込まれた場合は全件を原因候補とする（無限再投入の防止）
+        return [], rerun
+    return rerun, crashed
+
+def _iter_parallel_results(jobs, days, today, force, max_workers, job_timeout, png=True, forecaster=DEFAULT_FORECASTER, forecasts=None):
+    queue = list(jobs)
+    suspects = []
+    while queue:
+        queue, crashed = yield from _run_pool(queue, days, today, force, max_workers, job_timeout, png, forecaster, forecasts)
+        suspects.extend(crashed)
+
+    # 異常終了に巻き込まれたジョブは1件ずつ単独で再実行し、原因のジョブだけを失敗扱いにする
+    for job in suspects:
+        _, crashed = yield from _run_pool([job], days, today, force, 1, job_timeout, png, forecaster, forecasts)
+        if crashed:
+            yield job, f"❌ {job[1]} - エラー: ワーカープロセスが異常終了しました"
+
+def batch_forecast_all_parallel(df, days=7, max_workers=None, job_timeout=BATCH_JOB_TIMEOUT, force=False, png=True, forecaster=DEFAULT_FORECASTER, profile=False):
+    # 進捗を逐次返すジェネレーター（yieldごとにそれまでのログ全文を返す）
+    # 各ワーカーが学習とPNGの描画をまとめて行う（まとめて学習できるモデルは事前に学習し、ワーカーは保存と描画のみ）
+    # ワーカーで計測した区間も合算し、最後に段階ごとの所要時間をログへ追記する
+    today = datetime.today().strftime("%Y-%m-%d")
+    max_workers = max_workers or os.cpu_count() or 1
+    halls = hall_names(df)
+    logs = []
+    jobs = []
+    with collect("一括予測", profile) as record:
+        with span("ジョブの準備"):
+            for hall in halls:
+                logs.append(f"🏢 {hall} の予測を開始...")
+                jobs.extend(prepare_hall_jobs(df, hall))
+
+        start = time.monotonic()
+        forecasts = _prefit_or_log(jobs, days, today, force, png, forecaster, logs)
+        logs.append(f"🚀 {len(jobs)}件の予測ジョブを{max_workers}プロセスで実行します")
+        yield "\n".join(logs)
+
+        finished = 0
+        results = _iter_parallel_results(jobs, days, today, force, max_workers, job_timeout, png, forecaster, forecasts)
+        try:
+            for job, message in results:
+                finished += 1
+                if message is not None:
+                    logs.append(f"[{finished}/{len(jobs)}] {job[0]} / {message}")
+                    yield "\n".join(logs)
+        finally:
+            # キャンセル時もプールを確実に破棄する
+            results.close()
+
+    logs.append(f"🏁 全{len(jobs)}件完了（{time.monotonic() - start:.1f}秒）")
+    logs.append(summary(record))
+    _write_batch_log(logs)
+    evict_forecast_cache()
+    yield "\n".join(logs)
@@ -1,56 +1,61 @@
-
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import classification_report
-from sklearn.preprocessing import LabelEncoder
-import xgboost as xgb
-import pandas as pd
-
+import numpy as np
+from .model_store import XGB_N_JOBS, encode_machine_names, fit_or_update
+from ..loader import get_cube, dataset_key, get_feature_table, hall_names, latest_date, latest_rows, latest_positions, require_features, is_out_of_core
+from ..feature_store import FEATURE_COLUMNS, feature_rows
+from ..memo import memoized
+from ..instrumentation import timed, span, count
+
+@memoized
+@timed()
 def compute_high_setting_score(df):
-    df['スコア'] = df['差枚'] * (df['G数'] / df['G数'].mean())
-    df['スコア'] = df['スコア'].fillna(0)
+    g_mean = get_cube(df)["G数_mean"]
     result = []
-    for hall_name, group in df.groupby('ホール名'):
+    for hall_name in sorted(hall_names(df)):
         result.append(f"🏢 ホール名: {hall_name}")
-        latest_date = group['日付'].max()
-        recent = group[group['日付'] == latest_date]
+        recent = latest_rows(df, hall_name)
+        # スコアは表示する最新日の行だけで計算する
+        recent = recent.assign(スコア=(recent['差枚'] * (recent['G数'] / g_mean)).fillna(0))
+        latest = latest_date(df, hall_name)
         top = recent.sort_values('スコア', ascending=False).head(10)
-        result.append(f"[{latest_date.date()} 高設定スコア上位]")
+        result.append(f"[{latest.date()} 高設定スコア上位]")
         result.append(top[['機種名', '台番号', '差枚', 'G数', 'スコア']].to_string(index=False))
         result.append("")
     return "\n".join(result)
 
-def predict_high_setting_xgb(df):
+def predict_high_setting_xgb(df, n_jobs=XGB_N_JOBS):
+    if is_out_of_core(df):
+        return "⚠️ XGBoost予測は全期間の行を使うため、メモリに載せない取り込みでは使えません。"
     if df is None or df.empty:
         return "❌ 先にCSVを読み込んでください。"
 
     try:
-        df = df.copy()
-        if "機種名コード" not in df.columns:
-            df["機種名コード"] = LabelEncoder().fit_transform(df["機種名"])
-
-        features = ["G数", "差枚", "曜日", "末尾", "スコア", "機種名コード"]
-        X = df[features]
+        # 最新日の行位置は読み込み時の索引から取る。dfはコピーせず、特徴量の列だけを組み立てる
+        # 台ごとの過去成績（直近の平均差枚・高設定率など）は特徴量ストアから行に合わせて取る
+        base = ["G数", "差枚", "曜日", "末尾", "スコア"]
+        features = base + ["機種名コード"] + FEATURE_COLUMNS
+        df = require_features(df, base + ["高設定"])
+        target_date = latest_date(df)
+        positions = latest_positions(df)
+        history = feature_rows(get_feature_table(df), df)
+        with span("特徴量の作成"):
+            codes = df["機種名コード"] if "機種名コード" in df.columns else encode_machine_names(df["機種名"])
+            X = df[base].assign(機種名コード=np.asarray(codes), **{col: history[col].to_numpy() for col in FEATURE_COLUMNS})
         y = df["高設定"]
+        count("rows", len(df))
 
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-        model = xgb.XGBClassifier(use_label_encoder=False, eval_metric="logloss", n_jobs=2)
-        model.fit(X_train, y_train)
-
-        df["予測確率"] = model.predict_proba(X)[:, 1]
-        df["日付"] = pd.to_datetime(df["日付"])  # 念のため明示
-        latest_date = df["日付"].max()
+        with span("XGBoost学習"):
+            model, status = fit_or_update(X, y, df["日付"], features, n_jobs, dataset_key(df), get_cube(df)["G数_mean"])
 
-        recent = df[df["日付"].dt.date == latest_date.date()]
-        print("最新日付:", latest_date)
-        print("該当件数:", len(recent))
-        print("全日付一覧:", df["日付"].dropna().sort_values().unique())
+        # 表示するのは最新日だけなので、予測もその行に絞る
+        with span("XGBoost予測"):
+            recent = df.iloc[positions].assign(予測確率=model.predict_proba(X.iloc[positions])[:, 1])
 
         if recent.empty:
-            return f"⚠️ {latest_date.date()} のデータが存在しません。prepared_for_xgb.csv を確認してください。"
+            return f"⚠️ {target_date.date()} のデータが存在しません。prepared_for_xgb.csv を確認してください。"
 
         top10 = recent.sort_values("予測確率", ascending=False).head(10)
 
-        result = [f"🧠 XGBoost 狙い台予測（{latest_date.date()}）"]
+        result = [f"🧠 XGBoost 狙い台予測（{target_date.date()}、{status}）"]
         result.append(top10[["ホール名", "機種名", "台番号", "G数", "差枚", "スコア", "予測確率"]].to_string(index=False))
         return "\n".join(result)
 
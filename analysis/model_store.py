@@ -0,0 +1,76 @@
+import hashlib
+import json
+import os
+import pandas as pd
+from ..utils import read_json, write_json, date_digests, appended_dates
+
+MODEL_DIR = "output/cache/xgb"
+XGB_N_JOBS = 2
+XGB_PARAMS = {"eval_metric": "logloss"}
+INCREMENTAL_ESTIMATORS = 20  # 追加された日付分の学習で増やす木の本数
+# スコアは全期間のG数平均で割り直されるため日が増えると過去分も値が変わる。
+# 比率が変わるだけなので学習データの同一性の判定からは外し、代わりに学習時のG数平均を保存して
+# SCALE_TOLERANCE を超えて変わった場合は（既存の木と尺度が合わなくなるため）全期間で再学習する
+RESCALED_FEATURES = ["スコア"]
+SCALE_TOLERANCE = 0.02
+_MACHINE_CODES_NAME = "machine_codes.json"
+
+def encode_machine_names(names):
+    # 機種名→コードの対応を保存しておき、新しい機種には続きの番号を振る（既存のコードは変わらない）
+    path = os.path.join(MODEL_DIR, _MACHINE_CODES_NAME)
+    codes = read_json(path, {})
+    new_names = [name for name in pd.unique(names.dropna()) if str(name) not in codes]
+    if new_names:
+        for name in sorted(map(str, new_names)):
+            codes[name] = len(codes)
+        write_json(path, codes)
+    return names.astype(str).map(codes).where(names.notna()).astype(float)
+
+def daily_digests(X, y, dates):
+    # 日付ごとの学習データのハッシュ。前回との比較で「追加された日」と「変わった日」を見分ける
+    return date_digests(pd.util.hash_pandas_object(X.assign(_label=y), index=False), dates)
+
+def _store_paths(features, dataset_key):
+    # データセット（ホールの組み合わせ）ごとに別のモデルを保存し、切り替えても互いを上書きしない
+    key = hashlib.sha256(json.dumps({"features": features, "params": XGB_PARAMS}, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+    name = f"xgb_{dataset_key}_{key}"
+    return os.path.join(MODEL_DIR, f"{name}.json"), os.path.join(MODEL_DIR, f"{name}.meta.json")
+
+def _same_scale(meta, scale):
+    previous = meta.get("scale")
+    return previous is not None and scale is not None and abs(scale - previous) <= SCALE_TOLERANCE * abs(previous)
+
+def fit_or_update(X, y, dates, features, n_jobs=XGB_N_JOBS, dataset_key="default", scale=None):
+    # 学習データが前回と同じなら保存済みモデルを使い、日付が増えただけなら追加分だけで学習を続ける
+    # scale はスコアの計算に使ったG数平均。前回から大きく変わっていれば全期間で再学習する
+    # 返り値は (モデル, 状態の説明)
+    import xgboost as xgb
+    model_path, meta_path = _store_paths(features, dataset_key)
+    digests = daily_digests(X.drop(columns=RESCALED_FEATURES, errors="ignore"), y, dates)
+    meta = read_json(meta_path, None)
+
+    if meta is not None and os.path.exists(model_path):
+        trained = meta["digests"]
+        if trained == digests:
+            model = xgb.XGBClassifier(n_jobs=n_jobs, **XGB_PARAMS)
+            model.load_model(model_path)
+            return model, "保存済みモデルを使用"
+
+        new_dates = appended_dates(trained, digests)
+        if new_dates is not None and _same_scale(meta, scale):
+            new_rows = pd.to_datetime(dates).dt.strftime("%Y-%m-%d").isin(new_dates).to_numpy()
+            model = xgb.XGBClassifier(n_estimators=INCREMENTAL_ESTIMATORS, n_jobs=n_jobs, **XGB_PARAMS)
+            model.fit(X[new_rows], y[new_rows], xgb_model=model_path)
+            model.save_model(model_path)
+            # 尺度の基準は全期間で学習したときの値のまま据え置く（追加学習の繰り返しで少しずつずれるのを防ぐ）
+            write_json(meta_path, {"features": features, "digests": digests, "scale": meta["scale"]})
+            return model, f"追加学習（{len(new_dates)}日分）"
+
+    from sklearn.model_selection import train_test_split
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    model = xgb.XGBClassifier(n_jobs=n_jobs, **XGB_PARAMS)
+    model.fit(X_train, y_train)
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    model.save_model(model_path)
+    write_json(meta_path, {"features": features, "digests": digests, "scale": scale})
+    return model, "全期間で再学習"
@@ -0,0 +1,49 @@
+import threading
+from ..utils import get_japanese_font
+from ..instrumentation import span
+
+# pyplotのグローバル状態を使わず、Aggバックエンドの Figure を直接描画する
+# Figureはスレッドごと・サイズごとに1枚を使い回す（描画のたびにclearする）
+_local = threading.local()
+
+def get_axes(figsize):
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    figures = _local.__dict__.setdefault("figures", {})
+    fig = figures.get(figsize)
+    if fig is None:
+        fig = Figure(figsize=figsize)
+        FigureCanvasAgg(fig)
+        figures[figsize] = fig
+    else:
+        fig.clear()
+    return fig, fig.add_subplot()
+
+def to_image(fig):
+    # PNGへのエンコード・デコードを挟まず、描画バッファからそのまま画像にする
+    from PIL import Image
+    with span("グラフ描画"):
+        fig.tight_layout()
+        canvas = fig.canvas
+        canvas.draw()
+        return Image.frombuffer("RGBA", canvas.get_width_height(), canvas.buffer_rgba(), "raw", "RGBA", 0, 1).convert("RGB")
+
+def draw_forecast(history, forecast, title, figsize=(10, 4)):
+    jp_font = get_japanese_font()
+    fig, ax = get_axes(figsize)
+    ax.plot(history['ds'], history['y'], label="実績", linewidth=2)
+    ax.plot(forecast['ds'], forecast['yhat'], label="予測", linestyle="--")
+    ax.fill_between(forecast['ds'], forecast['yhat_lower'], forecast['yhat_upper'], color="gray", alpha=0.3)
+    ax.set_title(title, fontproperties=jp_font)
+    ax.set_ylabel("平均差枚", fontproperties=jp_font)
+    ax.set_xlabel("日付", fontproperties=jp_font)
+    ax.legend(prop=jp_font)
+    ax.grid(True)
+    return fig
+
+def render_forecast_png(png_path, history, forecast, title):
+    # 一括予測の描画プールから呼ばれる（プロセス間で渡すためモジュール直下の関数にしている）
+    image = to_image(draw_forecast(history, forecast, title))
+    with span("PNG保存"):
+        image.save(png_path)
+    return png_path
@@ -0,0 +1,112 @@
+# basic_stats のテキストレポートについて、旧実装（グループごとのPythonループ）とベクトル化版の
+# 結果一致と実行時間を比較する。
+#   python -m extensions.csv_analysis.benchmarks.bench_basic_stats --halls 20 --machines 400 --days 365
+import argparse
+import time
+import pandas as pd
+from ..analysis import basic_stats
+from .synthetic import make_prepared_frame
+
+def legacy_analyze_by_weekday(df):
+    df = df.copy()
+    weekday_labels = ['月', '火', '水', '木', '金', '土', '日']
+    df['曜日'] = df['日付'].dt.dayofweek.map(lambda x: weekday_labels[x] if pd.notnull(x) else '')
+    df['勝ち'] = df['差枚'] > 0
+    stats = df.groupby(['ホール名', '曜日', '機種名'])['勝ち'].mean().reset_index()
+    stats.columns = ['ホール名', '曜日', '機種名', '勝率']
+    result = []
+    for hall_name, group in stats.groupby('ホール名'):
+        result.append(f"🏢 ホール名: {hall_name}")
+        top10 = group.sort_values('勝率', ascending=False).head(10)
+        result.append(top10.to_string(index=False))
+        result.append("")
+    return "\n".join(result)
+
+def legacy_analyze_high_win_freq(df):
+    win_df = df[df['差枚'] > 1000]
+    result = []
+    for hall_name, group in win_df.groupby('ホール名'):
+        result.append(f"🏢 ホール名: {hall_name}")
+        freq = group.groupby(['機種名', '台番号']).size().reset_index(name='出現回数')
+        top10 = freq.sort_values('出現回数', ascending=False).head(10)
+        result.append("[差枚+1000以上 出現頻度トップ10]")
+        result.append(top10.to_string(index=False))
+        result.append("")
+    return "\n".join(result)
+
+def legacy_analyze_tail_numbers(df):
+    df = df.copy()
+    df['台番号'] = pd.to_numeric(df['台番号'], errors='coerce')
+    df = df[df['台番号'].notna()].copy()
+    df['末尾'] = df['台番号'].astype(int) % 10
+    win_df = df[df['差枚'] > 1000]
+    result = []
+    for hall_name, group in win_df.groupby('ホール名'):
+        result.append(f"🏢 ホール名: {hall_name}")
+        tail_counts = group['末尾'].value_counts().sort_index()
+        result.append("🔢 末尾別 +1000枚 出現回数:")
+        result.append(tail_counts.to_string())
+        result.append("")
+    return "\n".join(result)
+
+def legacy_analyze_consecutive_hits(df):
+    df = df.copy()
+    df['台番号'] = pd.to_numeric(df['台番号'], errors='coerce')
+    df = df[df['台番号'].notna()]
+    win_df = df[df['差枚'] > 1000]
+    result = []
+    for hall_name, group in win_df.groupby(['ホール名', '日付']):
+        hall, date = hall_name
+        group = group.sort_values('台番号')
+        numbers = group['台番号'].astype(int).tolist()
+        streaks = []
+        current_streak = [numbers[0]] if numbers else []
+        for i in range(1, len(numbers)):
+            if numbers[i] == numbers[i - 1] + 1:
+                current_streak.append(numbers[i])
+            else:
+                if len(current_streak) >= 3:
+                    streaks.append(current_streak[:])
+                current_streak = [numbers[i]]
+        if len(current_streak) >= 3:
+            streaks.append(current_streak)
+        if streaks:
+            result.append(f"🏢 {hall} ({date.date()}): 3連番以上の出現")
+            for s in streaks:
+                result.append(f"  → {s}")
+            result.append("")
+    if not result:
+        return "3連番以上の出現は確認されませんでした。"
+    return "\n".join(result)
+
+CASES = [
+    ("analyze_by_weekday", legacy_analyze_by_weekday, basic_stats.analyze_by_weekday),
+    ("analyze_high_win_freq", legacy_analyze_high_win_freq, basic_stats.analyze_high_win_freq),
+    ("analyze_tail_numbers", legacy_analyze_tail_numbers, basic_stats.analyze_tail_numbers),
+    ("analyze_consecutive_hits", legacy_analyze_consecutive_hits, basic_stats.analyze_consecutive_hits),
+]
+
+def _timed(func, df):
+    start = time.perf_counter()
+    result = func(df)
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--halls", type=int, default=10)
+    parser.add_argument("--machines", type=int, default=300)
+    parser.add_argument("--days", type=int, default=365)
+    args = parser.parse_args()
+
+    df = make_prepared_frame(args.halls, args.machines, args.days)
+    # 旧実装はカテゴリ型を使う前の読み込み結果（文字列の列）を前提にしている
+    legacy_df = df.astype({col: object for col in df.select_dtypes("category").columns})
+    print(f"{len(df):,}行（{args.halls}ホール × {args.machines}台 × {args.days}日）")
+    for name, legacy, vectorized in CASES:
+        expected, legacy_time = _timed(legacy, legacy_df)
+        actual, vectorized_time = _timed(vectorized, df.copy())
+        status = "一致" if actual == expected else "不一致"
+        print(f"{name:<26} 旧 {legacy_time:7.2f}s  新 {vectorized_time:7.2f}s  {legacy_time / vectorized_time:5.1f}倍  結果{status}")
+
+if __name__ == "__main__":
+    main()
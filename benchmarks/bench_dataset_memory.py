@@ -0,0 +1,59 @@
+# get_df() が返す読み取り専用ビューに対して分析関数を実行し、
+# 従来の防御的コピー（func(df.copy())）と比べたピークメモリを出力する。
+# データセットが書き換えられないことは tests/test_dataset_immutability.py で確認する。
+#   python -m extensions.csv_analysis.benchmarks.bench_dataset_memory --halls 20 --machines 300 --days 365
+import argparse
+import time
+import tracemalloc
+from .. import loader
+from ..analysis import basic_stats
+from .synthetic import make_prepared_frame
+
+def make_dataset(halls, machines, days, seed=0):
+    loader._set_df(make_prepared_frame(halls, machines, days, seed))
+
+def _functions():
+    functions = [
+        basic_stats.analyze_by_weekday,
+        basic_stats.analyze_machine_trend,
+        basic_stats.perform_analysis,
+        basic_stats.analyze_high_win_freq,
+        basic_stats.analyze_tail_numbers,
+        basic_stats.analyze_consecutive_hits,
+    ]
+    try:
+        from ..analysis import machine_learning
+        functions.append(machine_learning.compute_high_setting_score)
+    except ImportError:
+        pass
+    return functions
+
+def _peak(func, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1], time.perf_counter() - start
+    finally:
+        tracemalloc.stop()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--halls", type=int, default=10)
+    parser.add_argument("--machines", type=int, default=300)
+    parser.add_argument("--days", type=int, default=365)
+    args = parser.parse_args()
+
+    make_dataset(args.halls, args.machines, args.days)
+    dataset = loader.get_df()
+    size = dataset.memory_usage(deep=True).sum()
+    print(f"{len(dataset):,}行 / {size / 1024 ** 2:.1f}MB")
+
+    for func in _functions():
+        # 旧来の呼び出し方（関数が書き換えても良いように丸ごとコピーしてから渡す）
+        copied_peak, copied_time = _peak(lambda: func(loader.get_df().copy()))
+        view_peak, view_time = _peak(func, loader.get_df())
+        print(f"{func.__name__:<28} コピー {copied_peak / 1024 ** 2:8.1f}MB {copied_time:6.2f}s  ビュー {view_peak / 1024 ** 2:8.1f}MB {view_time:6.2f}s")
+
+if __name__ == "__main__":
+    main()
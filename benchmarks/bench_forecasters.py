@@ -0,0 +1,100 @@
+# 予測モデルごとに、各系列の最後の --horizon 日を学習から外して予測し、
+# 学習・予測の所要時間と精度（MAE, RMSE, 予測区間の的中率）を比較する。
+# 参考として「直近28日の平均」をそのまま予測値にした場合の精度も出す。
+#   python -m extensions.csv_analysis.benchmarks.bench_forecasters --series 500 --length 180
+#   python -m extensions.csv_analysis.benchmarks.bench_forecasters --csv data/all.csv --limit 200
+import argparse
+import time
+from types import SimpleNamespace
+import numpy as np
+import pandas as pd
+from ..analysis.forecasters import FORECASTERS
+
+def make_series(count, length, seed=0):
+    # 機種ごとの日別平均差枚を模した系列（水準・曜日効果・緩いトレンド・大きめのノイズ）
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2024-01-01", periods=length)
+    weekday = dates.dayofweek.to_numpy()
+    series = []
+    for _ in range(count):
+        level = rng.normal(0, 300)
+        weekday_effect = rng.normal(0, 250, 7)
+        trend = rng.normal(0, 3)
+        y = level + weekday_effect[weekday] + trend * np.arange(length) + rng.normal(0, 600, length)
+        keep = rng.random(length) > 0.05  # 休業日などの欠けた日
+        series.append(pd.DataFrame({"ds": dates[keep], "y": y[keep]}))
+    return series
+
+def load_series(path, streaming):
+    from .. import loader
+    from ..aggregates import machine_daily_series
+    print(loader.analyze_csv(SimpleNamespace(name=path), streaming))
+    frame = loader.get_df()
+    cube = loader.get_cube(frame)
+    series = []
+    for hall_name, machine_name in cube["machine_daily"].index.droplevel("日付").unique():
+        grouped, _ = machine_daily_series(cube, hall_name, [machine_name])
+        series.append(grouped)
+    return series
+
+def split(series, horizon, min_train=10):
+    train, test = [], []
+    for grouped in series:
+        grouped = grouped.dropna(subset=["y"])
+        cutoff = grouped["ds"].max() - pd.Timedelta(days=horizon)
+        if (grouped["ds"] <= cutoff).sum() < min_train:
+            continue
+        train.append(grouped[grouped["ds"] <= cutoff].reset_index(drop=True))
+        test.append(grouped[grouped["ds"] > cutoff].reset_index(drop=True))
+    return train, test
+
+def score(forecasts, test):
+    errors, covered = [], []
+    for forecast, actual in zip(forecasts, test):
+        merged = actual.merge(forecast.assign(ds=pd.to_datetime(forecast["ds"])), on="ds")
+        errors.append((merged["yhat"] - merged["y"]).to_numpy())
+        if "yhat_lower" in merged:
+            covered.append(((merged["y"] >= merged["yhat_lower"]) & (merged["y"] <= merged["yhat_upper"])).to_numpy())
+    errors = np.concatenate(errors) if errors else np.array([])
+    coverage = np.concatenate(covered).mean() if covered else float("nan")
+    return np.abs(errors).mean(), np.sqrt((errors ** 2).mean()), coverage
+
+def naive_forecasts(train, horizon, window=28):
+    forecasts = []
+    for grouped in train:
+        last = grouped["ds"].max()
+        mean = grouped.loc[grouped["ds"] > last - pd.Timedelta(days=window), "y"].mean()
+        forecasts.append(pd.DataFrame({"ds": pd.date_range(last + pd.Timedelta(days=1), periods=horizon), "yhat": mean}))
+    return forecasts
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--series", type=int, default=300)
+    parser.add_argument("--length", type=int, default=180)
+    parser.add_argument("--horizon", type=int, default=7)
+    parser.add_argument("--csv", help="合成データの代わりに使うCSV（機種ごとの日別平均差枚で評価する）")
+    parser.add_argument("--streaming", action="store_true")
+    parser.add_argument("--limit", type=int, default=None, help="評価する系列数の上限（Prophetは1系列数秒かかる）")
+    parser.add_argument("--forecasters", nargs="+", default=list(FORECASTERS), choices=list(FORECASTERS))
+    args = parser.parse_args()
+
+    series = load_series(args.csv, args.streaming) if args.csv else make_series(args.series, args.length)
+    train, test = split(series[:args.limit], args.horizon)
+    print(f"{len(train)}系列、最後の{args.horizon}日を評価\n")
+    print(f"{'model':<16}{'total':>9}{'per series':>12}{'MAE':>9}{'RMSE':>9}{'coverage':>10}")
+
+    mae, rmse, _ = score(naive_forecasts(train, args.horizon), test)
+    print(f"{'naive(28d mean)':<16}{'-':>9}{'-':>12}{mae:>9.1f}{rmse:>9.1f}{'-':>10}")
+    for name in args.forecasters:
+        try:
+            start = time.perf_counter()
+            fitted = FORECASTERS[name]["fit_many"](train, args.horizon)
+            seconds = time.perf_counter() - start
+        except ImportError as e:
+            print(f"{name:<16}skipped ({e})")
+            continue
+        mae, rmse, coverage = score([forecast for forecast, _ in fitted], test)
+        print(f"{name:<16}{seconds:>8.2f}s{seconds / len(train) * 1000:>10.2f}ms{mae:>9.1f}{rmse:>9.1f}{coverage:>10.0%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# 拡張機能の各モジュールを新しいプロセスで読み込み、
+#  - 読み込み時間
+#  - 読み込み時点で重いライブラリ（Prophet, xgboost, sklearn, matplotlib など）が読み込まれていないこと
+# を確認する。重いライブラリが読み込まれていた場合、拡張機能のモジュールが読み込めなかった場合や
+# --budget 秒を超えた場合は終了コード1を返す。
+# gradio（text-generation-webui 側の依存）が入っていない環境では空のモジュールで代用して script も測る。
+#   python -m extensions.csv_analysis.benchmarks.bench_import_time --repeat 3
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+PACKAGE = __package__.rsplit(".", 1)[0]
+MODULES = ["loader", "jobs", "cli", "analysis.basic_stats", "analysis.visualization", "analysis.machine_learning", "analysis.forecasting", "script"]
+HEAVY_MODULES = ["prophet", "cmdstanpy", "xgboost", "sklearn", "matplotlib", "PIL.Image"]
+# 初回使用時に読み込まれる側の費用（参考値）
+DEFERRED_MODULES = ["prophet", "xgboost", "sklearn.model_selection", "matplotlib.pyplot"]
+
+_PROBE = """
+import importlib, importlib.util, json, sys, time, types
+stubbed = sys.argv[1] != "--no-stub" and importlib.util.find_spec("gradio") is None
+if stubbed:
+    sys.modules["gradio"] = types.ModuleType("gradio")
+start = time.perf_counter()
+try:
+    importlib.import_module(sys.argv[2])
+except ImportError as e:
+    print(json.dumps({"error": str(e)}))
+    sys.exit()
+seconds = time.perf_counter() - start
+print(json.dumps({"seconds": seconds, "heavy": [name for name in sys.argv[3:] if name in sys.modules], "stubbed": stubbed}))
+"""
+
+def probe(module, heavy=(), stub=True):
+    # 親プロセスと同じ作業ディレクトリで実行し、パッケージの解決方法を揃える
+    result = subprocess.run([sys.executable, "-c", _PROBE, "--stub" if stub else "--no-stub", module, *heavy], capture_output=True, text=True, cwd=os.getcwd())
+    lines = result.stdout.strip().splitlines()
+    if not lines:
+        return {"error": result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "no output"}
+    return json.loads(lines[-1])
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--budget", type=float, default=None, help="1モジュールあたりの読み込み時間の上限（秒）")
+    args = parser.parse_args()
+
+    failed = False
+    stubbed = False
+    print(f"{'module':<28}{'import':>10}  heavy modules loaded")
+    for name in MODULES:
+        runs = [probe(f"{PACKAGE}.{name}", HEAVY_MODULES) for _ in range(args.repeat)]
+        if "error" in runs[0]:
+            failed = True
+            print(f"{name:<28}{'failed':>10}  ({runs[0]['error']})")
+            continue
+        seconds = min(run["seconds"] for run in runs)
+        heavy = runs[0]["heavy"]
+        over = args.budget is not None and seconds > args.budget
+        failed |= bool(heavy) or over
+        stubbed |= runs[0]["stubbed"]
+        print(f"{name:<28}{seconds:>9.3f}s  {', '.join(heavy) or '-'}{'  (over budget)' if over else ''}")
+
+    if stubbed:
+        print("（gradio が入っていないため空のモジュールで代用して測定）")
+
+    print("\n初回使用時に読み込まれるライブラリ（参考）")
+    for name in DEFERRED_MODULES:
+        run = probe(name, stub=False)
+        print(f"{name:<28}{'skipped' if 'error' in run else format(run['seconds'], '>9.3f') + 's':>10}")
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+# 合成データ（synthetic.py）で主要な処理を段階ごとに計測し、
+# 実行時間・スループット（行/秒、系列/秒）・ピークメモリ（tracemalloc）を規模別に出力する。
+# --save で結果を基準値として保存し、--compare で基準値と比べて遅くなった段階を検出する（検出時は終了コード1）。
+# 基準値の既定は benchmarks/baselines/small.json（small規模、リポジトリに同梱）。比較は基準値にある規模・段階だけを対象にする。
+# 所要時間は実行環境に依存するため、別の環境で比較する場合は先にその環境で基準値を作り直す。
+# ピークメモリは別の1回をtracemalloc下で実行して測る（文字列処理の多い段階はその分遅くなる）。
+#   python -m extensions.csv_analysis.benchmarks.bench_pipeline --scales small --repeat 3 --save   # 基準値の作り直し
+#   python -m extensions.csv_analysis.benchmarks.bench_pipeline --scales small --compare
+#   python -m extensions.csv_analysis.benchmarks.bench_pipeline --scales medium --save output/benchmarks/medium.json
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+import numpy as np
+import pandas as pd
+from .. import loader, ingest_cache, feature_store, memo
+from ..analysis import basic_stats, forecast_cache, forecasting, model_store
+from .synthetic import write_raw_csv
+
+SCALES = {
+    "small": (2, 100, 30),
+    "medium": (10, 300, 90),
+    "large": (20, 500, 365),
+}
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "small.json")
+REPORTS = ["analyze_by_weekday", "analyze_machine_trend", "perform_analysis", "analyze_high_win_freq", "analyze_tail_numbers", "analyze_consecutive_hits"]
+
+def _clear(path):
+    shutil.rmtree(path, ignore_errors=True)
+
+def build_stages(csv_path, forecaster):
+    # (段階名, 準備, 計測対象, 系列数を返す関数) のリスト。準備は計測に含めない
+    state = {}
+    file = SimpleNamespace(name=csv_path)
+
+    def read_raw():
+        state["raw"] = pd.read_csv(csv_path, dtype=str)
+
+    def first_hall_jobs():
+        return len(forecasting.prepare_hall_jobs(loader.get_df(), loader.get_halls()[0]))
+
+    def reset_cube():
+        loader._cube = None
+
+    stages = [
+        ("clean_numeric_columns", read_raw, lambda: loader.clean_numeric_columns(state["raw"].copy()), None),
+        ("analyze_csv(cold)", lambda: _clear(ingest_cache.INGEST_CACHE_DIR), lambda: loader.analyze_csv(file, True), None),
+        ("analyze_csv(cached)", None, lambda: loader.analyze_csv(file, True), None),
+        ("get_cube", reset_cube, lambda: loader.get_cube(loader.get_df()), None),
+        ("get_latest_machines", None, lambda: [loader.get_latest_machines(hall) for hall in loader.get_halls()], None),
+    ]
+    # レポートは結果のメモを空にしてから計測し、メモ命中時の所要時間は別の段階で測る
+    for name in REPORTS:
+        stages.append((f"basic_stats.{name}", memo.clear, lambda name=name: getattr(basic_stats, name)(loader.get_df()), None))
+    trend = lambda: basic_stats.analyze_machine_trend(loader.get_df())
+    stages.append(("basic_stats.analyze_machine_trend(memo)", trend, trend, None))
+    stages += [
+        ("predict_high_setting_xgb(cold)", _clear_models, lambda: _predict(), None),
+        ("predict_high_setting_xgb(saved)", None, lambda: _predict(), None),
+        ("batch_forecast_for_hall", lambda: (_clear(forecast_cache.CACHE_DIR), _clear(forecasting.BATCH_OUTPUT_ROOT)),
+         lambda: forecasting.batch_forecast_for_hall(loader.get_df(), loader.get_halls()[0], 7, force=True, forecaster=forecaster), first_hall_jobs),
+    ]
+    return stages
+
+def _clear_models():
+    # xgboost の初回読み込みは計測に含めない（繰り返し回数によって結果が変わらないように）
+    import xgboost  # noqa: F401
+    _clear(model_store.MODEL_DIR)
+
+def _predict():
+    from ..analysis.machine_learning import predict_high_setting_xgb
+    return predict_high_setting_xgb(loader.get_df())
+
+def _run(setup, func, trace):
+    if setup is not None:
+        setup()
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        func()
+        return time.perf_counter() - start, tracemalloc.get_traced_memory()[1] if trace else None
+    finally:
+        if trace:
+            tracemalloc.stop()
+
+def run_scale(name, halls, machines, days, forecaster, repeat, memory):
+    work_dir = tempfile.mkdtemp(prefix="csv_analysis_bench_")
+    # キャッシュや成果物は作業フォルダへ向け、既存の output/ には触れない
+    ingest_cache.INGEST_CACHE_DIR = os.path.join(work_dir, "ingest")
+    forecast_cache.CACHE_DIR = os.path.join(work_dir, "forecast")
+    model_store.MODEL_DIR = os.path.join(work_dir, "xgb")
+    feature_store.FEATURE_DIR = os.path.join(work_dir, "features")
+    forecasting.BATCH_OUTPUT_ROOT = os.path.join(work_dir, "artifacts")
+    try:
+        csv_path = os.path.join(work_dir, "raw.csv")
+        rows = write_raw_csv(csv_path, halls, machines, days)
+        size = os.path.getsize(csv_path)
+        print(f"\n## {name}: {halls}ホール × {machines}台 × {days}日 = {rows:,}行（CSV {size / 1024 ** 2:.1f}MB）")
+        print(f"{'stage':<34}{'seconds':>9}{'rows/s':>13}{'series/s':>10}{'peak MB':>9}")
+        results = {}
+        for stage, setup, func, count_series in build_stages(csv_path, forecaster):
+            try:
+                seconds = min(_run(setup, func, False)[0] for _ in range(repeat))
+                peak = _run(setup, func, True)[1] if memory else None
+            except ImportError as e:
+                print(f"{stage:<34}skipped ({e})")
+                continue
+            series = count_series() if count_series else None
+            results[stage] = {"seconds": seconds, "rows_per_second": rows / seconds, "series_per_second": series / seconds if series else None, "peak_bytes": peak}
+            series_rate = f"{series / seconds:.1f}" if series else "-"
+            peak_mb = f"{peak / 1024 ** 2:.1f}" if peak is not None else "-"
+            print(f"{stage:<34}{seconds:>9.3f}{rows / seconds:>13,.0f}{series_rate:>10}{peak_mb:>9}")
+        return {"rows": rows, "csv_bytes": size, "stages": results}
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def compare(results, baseline, tolerance, floor=0.05):
+    # 基準値より tolerance 倍以上遅く、かつ差が floor 秒以上の段階を遅延として返す
+    regressions = []
+    for scale, result in results.items():
+        for stage, current in result["stages"].items():
+            previous = baseline.get("scales", {}).get(scale, {}).get("stages", {}).get(stage)
+            if previous is None:
+                continue
+            ratio = current["seconds"] / previous["seconds"]
+            if ratio > tolerance and current["seconds"] - previous["seconds"] > floor:
+                regressions.append((scale, stage, previous["seconds"], current["seconds"], ratio))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scales", nargs="+", default=["small", "medium"], choices=list(SCALES))
+    parser.add_argument("--forecaster", default="weekday_trend", help="batch_forecast_for_hall で使う予測モデル")
+    parser.add_argument("--repeat", type=int, default=1, help="実行時間は指定回数の最小値")
+    parser.add_argument("--no-memory", action="store_true", help="ピークメモリの計測（追加の1回）を省略する")
+    parser.add_argument("--save", nargs="?", const=BASELINE_PATH, help="結果を基準値として保存する")
+    parser.add_argument("--compare", nargs="?", const=BASELINE_PATH, help="保存済みの基準値と比較する")
+    parser.add_argument("--tolerance", type=float, default=1.3)
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.scales:
+        results[name] = run_scale(name, *SCALES[name], args.forecaster, args.repeat, not args.no_memory)
+
+    if args.save:
+        os.makedirs(os.path.dirname(args.save) or ".", exist_ok=True)
+        meta = {"python": platform.python_version(), "pandas": pd.__version__, "numpy": np.__version__, "machine": platform.machine(), "created": time.strftime("%Y-%m-%d %H:%M:%S")}
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"meta": meta, "scales": results}, f, ensure_ascii=False, indent=1)
+        print(f"\n基準値を保存しました: {args.save}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        print(f"\n基準値（{baseline['meta']['created']}）との比較: 許容 {args.tolerance}倍")
+        for scale, stage, previous, current, ratio in regressions:
+            print(f"⚠️ {scale} / {stage}: {previous:.3f}s → {current:.3f}s（{ratio:.2f}倍）")
+        if regressions:
+            sys.exit(1)
+        print("✅ 遅くなった段階はありません")
+
+if __name__ == "__main__":
+    main()
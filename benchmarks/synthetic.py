@@ -0,0 +1,106 @@
+# ベンチマーク用の合成ホールデータ（raw形式CSV）を作る。
+#  - ファイル名に日付（"ホール00_2024-01-01.csv"）
+#  - G数は桁区切り、差枚は符号・桁区切り付き（マイナスは全角"−"）
+#  - 確率列は "1/xxx"（回数0は "-"）
+# 台ごとに日替わりで設定1〜6を割り当て、設定・曜日・末尾の当たり日で差枚と確率が変わるようにしている。
+#   python -m extensions.csv_analysis.benchmarks.synthetic data/raw.csv --halls 10 --machines 300 --days 90
+#   python -m extensions.csv_analysis.benchmarks.synthetic data/raw_dir --per-day   # 1日1ファイル（フォルダ取り込み用）
+import argparse
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+
+MACHINE_MODELS = 40  # 機種数の上限（台は機種ごとにまとまって並ぶ）
+SETTING_WEIGHTS = [0.35, 0.25, 0.15, 0.1, 0.08, 0.07]
+SETTING_PAYOUT = np.array([-450, -250, -50, 150, 450, 800])  # 設定ごとの1日あたり平均差枚
+SETTING_BB = np.array([290.0, 280.0, 270.0, 255.0, 245.0, 235.0])  # 設定ごとのBB分母
+SETTING_RB = np.array([420.0, 380.0, 340.0, 300.0, 270.0, 240.0])
+RAW_COLUMNS = ["ファイル名", "ホール名", "機種名", "台番号", "G数", "差枚", "BB", "RB", "ART", "合成確率", "BB確率", "RB確率", "ART確率"]
+
+def _format_signed(values):
+    return [f"{v:+,}".replace("-", "−") for v in values.tolist()]
+
+def _format_probability(games, hits):
+    return [f"1/{g / h:.1f}" if h else "-" for g, h in zip(games.tolist(), hits.tolist())]
+
+def make_raw_frame(halls, machines, days, seed=0, start="2024-01-01"):
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(start, periods=days)
+    n = halls * days * machines
+    hall_idx = np.repeat(np.arange(halls), days * machines)
+    date_idx = np.tile(np.repeat(np.arange(days), machines), halls)
+    slot = np.tile(np.arange(machines), halls * days)
+    numbers = 1001 + slot
+    models = slot * min(MACHINE_MODELS, machines) // machines
+
+    # 当たり日: ホールごとの特定曜日と、日付の末尾と同じ末尾の台で高設定が増える
+    hot_weekday = rng.integers(0, 7, halls)[hall_idx]
+    day_of_month = dates.day.to_numpy()[date_idx]
+    boost = (dates.dayofweek.to_numpy()[date_idx] == hot_weekday) + (numbers % 10 == day_of_month % 10)
+    weights = np.array(SETTING_WEIGHTS)
+    hot_weights = weights[::-1]
+    draw = rng.random(n)
+    setting = np.where(boost > 0, np.searchsorted(np.cumsum(hot_weights), draw), np.searchsorted(np.cumsum(weights), draw))
+    setting = np.minimum(setting, 5)
+
+    games = np.clip(rng.normal(5000 + 600 * setting, 2200), 0, 11000).astype(int)
+    bb = rng.poisson(games / SETTING_BB[setting])
+    rb = rng.poisson(games / SETTING_RB[setting])
+    diff = np.round(SETTING_PAYOUT[setting] * games / 6000 + rng.normal(0, 1300, n) * np.sqrt(games / 6000)).astype(int)
+
+    hall_names = np.array([f"ホール{i:02d}" for i in range(halls)])
+    date_text = dates.strftime("%Y-%m-%d").to_numpy()
+    return pd.DataFrame({
+        "ファイル名": np.char.add(np.char.add(hall_names[hall_idx].astype(str), "_"), np.char.add(date_text[date_idx].astype(str), ".csv")),
+        "ホール名": hall_names[hall_idx],
+        "機種名": np.array([f"機種{i:02d}" for i in range(MACHINE_MODELS)])[models],
+        "台番号": numbers,
+        "G数": [f"{g:,}" for g in games.tolist()],
+        "差枚": _format_signed(diff),
+        "BB": bb,
+        "RB": rb,
+        "ART": 0,
+        "合成確率": _format_probability(games, bb + rb),
+        "BB確率": _format_probability(games, bb),
+        "RB確率": _format_probability(games, rb),
+        "ART確率": "-",
+    }, columns=RAW_COLUMNS)
+
+def write_raw_csv(path, halls, machines, days, seed=0):
+    frame = make_raw_frame(halls, machines, days, seed)
+    frame.to_csv(path, index=False)
+    return len(frame)
+
+def write_raw_directory(directory, halls, machines, days, seed=0):
+    # フォルダ取り込み（日付ごとのパーティション）用に1日1ファイルで書き出す
+    frame = make_raw_frame(halls, machines, days, seed)
+    os.makedirs(directory, exist_ok=True)
+    dates = frame["ファイル名"].str.slice(-14, -4)
+    for date, part in frame.groupby(dates, sort=True):
+        part.to_csv(os.path.join(directory, f"{date}.csv"), index=False)
+    return len(frame)
+
+def make_prepared_frame(halls, machines, days, seed=0):
+    # 合成CSVを実際の読み込み処理（loader.preprocess_csv）に通した、分析関数に渡す形のframe
+    from .. import loader
+    with tempfile.TemporaryDirectory(prefix="csv_analysis_synthetic_") as work_dir:
+        path = os.path.join(work_dir, "raw.csv")
+        write_raw_csv(path, halls, machines, days, seed)
+        return loader.preprocess_csv(path)[0]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path")
+    parser.add_argument("--halls", type=int, default=5)
+    parser.add_argument("--machines", type=int, default=200)
+    parser.add_argument("--days", type=int, default=60)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--per-day", action="store_true", help="1日1ファイルでフォルダに書き出す")
+    args = parser.parse_args()
+    write = write_raw_directory if args.per_day else write_raw_csv
+    rows = write(args.path, args.halls, args.machines, args.days, args.seed)
+    print(f"{rows:,}行を書き出しました: {args.path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import argparse
+import json
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+# 定期実行（cron等）向けの入口。UIを使わずに 取り込み → 集計 → 一括予測（成果物の保存）を実行する
+#   python -m extensions.csv_analysis.cli --dir data/ --workers 4
+# 進捗は1行1件のJSONで標準出力へ出す。重い依存（Prophet, matplotlib）は予測段階で初めて読み込む（描画はpyplotを使わずAggで行う）
+
+_START = time.perf_counter()
+_PROFILE = False
+
+def emit(event, **fields):
+    fields = {"event": event, "elapsed": round(time.perf_counter() - _START, 3), **fields}
+    print(json.dumps(fields, ensure_ascii=False, default=str), flush=True)
+
+def _stage(name, func, *args):
+    # 段階内の区間（CSV解析・学習・描画など）の所要時間と件数も stage_end に含める
+    from .instrumentation import collect
+    emit("stage_start", stage=name)
+    with collect(name, _PROFILE) as record:
+        result = func(*args)
+    spans = {stage: round(entry["seconds"], 3) for stage, entry in record["spans"].items()}
+    emit("stage_end", stage=name, seconds=round(record["seconds"], 3), spans=spans, counters=record["counters"], profile=record["profile_path"])
+    return result
+
+def _ingest(args):
+    from . import loader
+    loader.TRACE_MEMORY = args.trace_memory
+    if args.dir:
+        message = loader.analyze_directory(args.dir, out_of_core=args.out_of_core)
+    else:
+        message = loader.analyze_csv(SimpleNamespace(name=args.csv), args.streaming)
+    frame = loader.get_df()
+    emit("log", message=message)
+    if frame is None:
+        raise RuntimeError(message)
+    emit("dataset", rows=loader.row_count(frame), halls=len(loader.hall_names(frame)), peak_memory=loader.last_peak_memory, peak_memory_traced=loader.last_peak_traced)
+    return frame
+
+def _aggregate(frame):
+    from .loader import get_cube
+    cube = get_cube(frame)
+    emit("cube", series=len(cube["machine_daily"]))
+
+def _forecast(frame, args):
+    import_start = time.perf_counter()
+    from .analysis import forecasting
+    emit("import", module="forecasting", seconds=round(time.perf_counter() - import_start, 3))
+
+    if args.workers <= 1:
+        progress = forecasting.iter_batch_forecast_all(frame, args.days, force=args.force, png=not args.no_png, forecaster=args.forecaster)
+    else:
+        progress = forecasting.batch_forecast_all_parallel(frame, args.days, max_workers=args.workers, force=args.force, png=not args.no_png, forecaster=args.forecaster)
+    # 各ジェネレーターはそれまでのログ全文を返すため、新しい行だけを出力する
+    emitted = 0
+    failed = 0
+    for text in progress:
+        lines = text.split("\n")
+        for line in lines[emitted:]:
+            failed += "❌" in line or "⏱" in line
+            emit("job", message=line)
+        emitted = len(lines)
+    return failed
+
+def parse_args(argv=None):
+    from .analysis.forecasters import FORECASTERS, DEFAULT_FORECASTER
+    parser = argparse.ArgumentParser(description="csv_analysis の一括予測をUIなしで実行します")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--csv", help="読み込むCSVファイル")
+    source.add_argument("--dir", help="CSVフォルダ（新しい日付のファイルだけを追加取り込み）")
+    parser.add_argument("--streaming", action="store_true", help="CSVをチャンク読み込みする（--csv 指定時）")
+    parser.add_argument("--out-of-core", action="store_true", help="全体をメモリに載せず、集計・予測をパーティションごとに行う（--dir 指定時）")
+    parser.add_argument("--days", type=int, default=7, help="予測日数")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="並列プロセス数（1で逐次実行）")
+    parser.add_argument("--force", action="store_true", help="保存済みの成果物があっても予測し直す")
+    parser.add_argument("--forecaster", choices=list(FORECASTERS), default=DEFAULT_FORECASTER, help="予測モデル（weekday_trend は全機種をまとめて学習する高速モデル）")
+    parser.add_argument("--no-png", action="store_true", help="グラフ画像を描画せず予測CSVだけを保存する")
+    parser.add_argument("--profile", action="store_true", help="段階ごとに cProfile の結果を output/logs/profile へ保存する")
+    parser.add_argument("--trace-memory", action="store_true", help="ストリーミング読み込みのピークメモリを測る（読み込みが遅くなる）")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    global _PROFILE
+    args = parse_args(argv)
+    _PROFILE = args.profile
+    emit("start", argv=sys.argv[1:] if argv is None else argv)
+    try:
+        frame = _stage("ingest", _ingest, args)
+        _stage("aggregate", _aggregate, frame)
+        failed = _stage("forecast", _forecast, frame, args)
+    except Exception as e:
+        emit("error", message=str(e))
+        return 1
+    emit("done", failed=failed)
+    return 0 if failed == 0 else 2
+
+if __name__ == "__main__":
+    sys.exit(main())
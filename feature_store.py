@@ -0,0 +1,172 @@
+import os
+import numpy as np
+import pandas as pd
+from .utils import read_json, write_json, date_digests, appended_dates
+
+# 台（ホール名, 台番号, 機種名）ごとの過去の成績の特徴量。各日の値はその日を含まない直前の期間から計算する（当日の結果は使わない）
+# 同じ台番号でも機種が入れ替わった場合は別の台として扱う
+#   差枚平均N日 / 高設定率N日: 直前N日（カレンダー日）の平均差枚と高設定の日の割合（稼働のない日は数えない）
+#   前回高設定からの日数: 直前の高設定の日からの経過日数
+#   末尾高設定率N日: 同じホール・同じ末尾の台全体での直前N日の高設定の日の割合
+# 高設定の日は、その日の行（重複して取り込まれた行を含む）のどれかが差枚+1000以上の日
+# 表は (ホール名, 台番号, 機種名, 日付) をインデックスに持ち、日付が増えただけなら追加された日の行だけを計算して継ぎ足す
+# 保存先はデータセット（loader.dataset_key）ごとに分け、別のデータを読み込んでも互いを上書きしない
+FEATURE_DIR = "output/cache/features"
+WINDOWS = [3, 7, 30]
+TAIL_WINDOW = 30
+HIT_THRESHOLD = 1000
+MACHINE_KEYS = ["ホール名", "台番号", "機種名"]
+KEYS = MACHINE_KEYS + ["日付"]
+DAILY_COLUMNS = KEYS + ["差枚"]
+FEATURE_COLUMNS = [f"差枚平均{w}日" for w in WINDOWS] + [f"高設定率{w}日" for w in WINDOWS] + ["前回高設定からの日数", f"末尾高設定率{TAIL_WINDOW}日"]
+PARAMS = {"windows": WINDOWS, "tail_window": TAIL_WINDOW, "threshold": HIT_THRESHOLD}
+FEATURE_CHUNK = 2000  # 1度に行列へ並べる台の数の目安
+_NO_HIT = -10 ** 9  # 高設定の日がまだない台の「最後の高設定日」
+
+def _daily_partials(piece):
+    # 1つの部分の台ごと・日ごとの差枚の合計・件数・最大（部分をまたいで合算できる形）
+    return piece[DAILY_COLUMNS].groupby(KEYS, observed=True, sort=False)["差枚"].agg(["sum", "count", "max"])
+
+def daily_rows(pieces):
+    # 台ごと・日ごとの差枚（同じ日の重複行は平均）と、高設定の判定に使うその日の最大の差枚
+    # pieces は DAILY_COLUMNS を含むframeの並び。部分ごとに集計してから合算するため、全体の行を同時には持たない
+    partials = [_daily_partials(piece) for piece in pieces]
+    if len(partials) > 1:
+        partials = pd.concat(partials).groupby(level=KEYS, sort=False).agg({"sum": "sum", "count": "sum", "max": "max"})
+    else:
+        partials = partials[0]
+    partials = partials.sort_index()
+    mean = (partials["sum"] / partials["count"]).where(partials["count"] > 0)
+    return pd.DataFrame({"差枚": mean, "差枚最大": partials["max"]})
+
+def _prefix(values):
+    # 日方向の累積和（先頭に0の列を足し、[a, b) の合計を prefix[:, b] - prefix[:, a] で取れるようにする）
+    out = np.zeros((values.shape[0], values.shape[1] + 1))
+    np.cumsum(values, axis=1, out=out[:, 1:])
+    return out
+
+def _window(prefix, rows, days, window):
+    return prefix[rows, days] - prefix[rows, np.maximum(days - window, 0)]
+
+def compute_features(daily, last_hits=None):
+    # daily（daily_rows の結果）の全行について特徴量を計算する
+    # last_hits は daily の期間より前の最後の高設定日（(ホール名, 台番号, 機種名) → 日付）。追加計算で使う
+    # 台 × 日 の行列がメモリに収まるよう、同じホール・同じ末尾の台をまとめて FEATURE_CHUNK 台程度ずつ計算する
+    codes, uniques = pd.factorize(daily.index.droplevel("日付"))
+    groups, _ = pd.factorize(pd.MultiIndex.from_arrays([uniques.get_level_values(0), uniques.get_level_values(1).to_numpy() % 10]))
+    sizes = np.bincount(groups) if len(groups) else np.array([], dtype=np.int64)
+    chunks = ((np.cumsum(sizes) - sizes) // FEATURE_CHUNK)[groups[codes]]
+    features = {name: np.full(len(daily), np.nan) for name in FEATURE_COLUMNS}
+    order = np.argsort(chunks, kind="stable")
+    for rows in np.split(order, np.flatnonzero(np.diff(chunks[order])) + 1):
+        if len(rows):
+            for name, values in _chunk_features(daily.iloc[rows], last_hits).items():
+                features[name][rows] = values
+    return daily.assign(**features)
+
+def _chunk_features(daily, last_hits):
+    # 末尾ごとの特徴量のため、daily には同じホール・同じ末尾の台の行がそろっていること
+    machines = daily.index.droplevel("日付")
+    codes, uniques = pd.factorize(machines)
+    dates = daily.index.get_level_values("日付")
+    day0 = dates.min()
+    days = ((dates - day0) // pd.Timedelta(days=1)).to_numpy(dtype=np.int64)
+
+    # 台 × 日 の行列（稼働のない日はNaN）に並べ、累積和の差で各期間の合計を取る
+    value = np.full((len(uniques), days.max() + 1), np.nan)
+    value[codes, days] = daily["差枚"].to_numpy(dtype=float)
+    observed = ~np.isnan(value)
+    hit = np.zeros(value.shape, dtype=bool)
+    hit[codes, days] = daily["差枚最大"].to_numpy(dtype=float) > HIT_THRESHOLD
+    sums, counts, hits = _prefix(np.where(observed, value, 0.0)), _prefix(observed), _prefix(hit)
+
+    features = {}
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for window in WINDOWS:
+            n = _window(counts, codes, days, window)
+            features[f"差枚平均{window}日"] = np.where(n > 0, _window(sums, codes, days, window) / n, np.nan)
+        for window in WINDOWS:
+            n = _window(counts, codes, days, window)
+            features[f"高設定率{window}日"] = np.where(n > 0, _window(hits, codes, days, window) / n, np.nan)
+
+        # 直前の高設定日: 各日までの高設定日の最大値（期間より前の分は last_hits から始める）
+        seed = np.full(len(uniques), _NO_HIT, dtype=np.int64)
+        if last_hits is not None and len(last_hits):
+            known = last_hits.reindex(uniques)
+            seed = np.where(known.notna(), ((known - day0) // pd.Timedelta(days=1)).fillna(_NO_HIT).to_numpy(dtype=np.int64), _NO_HIT)
+        latest = np.empty((len(uniques), value.shape[1] + 1), dtype=np.int64)
+        latest[:, 0] = seed
+        latest[:, 1:] = np.maximum.accumulate(np.maximum(np.where(hit, np.arange(value.shape[1]), _NO_HIT), seed[:, None]), axis=1)
+        last = latest[codes, days]
+        features["前回高設定からの日数"] = np.where(last > _NO_HIT, days - last, np.nan)
+
+        # 末尾ごと: 同じホール・同じ末尾の台の累積和を合計してから期間の差を取る
+        halls = uniques.get_level_values(0)
+        tails = uniques.get_level_values(1).to_numpy() % 10
+        groups, _ = pd.factorize(pd.MultiIndex.from_arrays([halls, tails]))
+        group_hits = pd.DataFrame(hits).groupby(groups).sum().to_numpy()
+        group_counts = pd.DataFrame(counts).groupby(groups).sum().to_numpy()
+        n = _window(group_counts, groups[codes], days, TAIL_WINDOW)
+        features[f"末尾高設定率{TAIL_WINDOW}日"] = np.where(n > 0, _window(group_hits, groups[codes], days, TAIL_WINDOW) / n, np.nan)
+
+    return features
+
+def _compute_since(daily, start):
+    # start 以降の日だけを、最長の期間ぶん前からの行と、それより前の最後の高設定日を使って計算する
+    dates = daily.index.get_level_values("日付")
+    context_start = start - pd.Timedelta(days=max(WINDOWS + [TAIL_WINDOW]))
+    before = daily[(dates < context_start) & (daily["差枚最大"] > HIT_THRESHOLD).to_numpy()]
+    last_hits = before.reset_index().groupby(MACHINE_KEYS, observed=True)["日付"].max()
+    table = compute_features(daily[dates >= context_start], last_hits)
+    return table[table.index.get_level_values("日付") >= start]
+
+def daily_digests(daily):
+    # 日付ごとの入力のハッシュ。前回との比較で「追加された日」と「変わった日」を見分ける
+    rows = daily.reset_index()
+    return date_digests(pd.util.hash_pandas_object(rows[MACHINE_KEYS + ["差枚", "差枚最大"]], index=False), rows["日付"])
+
+def _paths(dataset_key):
+    return os.path.join(FEATURE_DIR, f"features_{dataset_key}.pkl"), os.path.join(FEATURE_DIR, f"features_{dataset_key}.meta.json")
+
+def _load(dataset_key):
+    table_path, meta_path = _paths(dataset_key)
+    meta = read_json(meta_path)
+    if meta is None or not os.path.exists(table_path):
+        return None, None
+    return meta, pd.read_pickle(table_path)
+
+def _save(table, digests, dataset_key):
+    table_path, meta_path = _paths(dataset_key)
+    os.makedirs(FEATURE_DIR, exist_ok=True)
+    table.to_pickle(table_path + ".tmp")
+    os.replace(table_path + ".tmp", table_path)
+    write_json(meta_path, {"params": PARAMS, "digests": digests})
+
+def update_features(daily, dataset_key="default"):
+    # 入力が前回と同じなら保存済みの表を使い、日付が増えただけなら追加された日の行だけを計算する
+    # 返り値は (表, 状態の説明)
+    digests = daily_digests(daily)
+    meta, table = _load(dataset_key)
+    status = "全期間で計算"
+    if meta is not None and meta["params"] == PARAMS:
+        computed = meta["digests"]
+        if computed == digests:
+            return table, "保存済みの特徴量を使用"
+        new_dates = appended_dates(computed, digests)
+        if new_dates is not None:
+            table = pd.concat([table, _compute_since(daily, pd.Timestamp(new_dates[0]))]).sort_index()
+            status = f"追加計算（{len(new_dates)}日分）"
+        else:
+            table = None
+    else:
+        table = None
+
+    if table is None:
+        table = compute_features(daily)
+    _save(table, digests, dataset_key)
+    return table, status
+
+def feature_rows(table, frame):
+    # frame の各行に対応する特徴量（行の並びは frame と同じ。表にない行はNaN）
+    keys = pd.MultiIndex.from_arrays([frame[key] for key in KEYS], names=KEYS)
+    return table[FEATURE_COLUMNS].reindex(keys)
@@ -0,0 +1,127 @@
+import hashlib
+import inspect
+import json
+import os
+import time
+from .instrumentation import span, count
+from .utils import read_json, write_json
+
+INGEST_CACHE_DIR = "output/cache/ingest"
+_MANIFEST_NAME = "manifest.json"
+_FORMAT_VERSION = 1
+_HASH_CHUNK_SIZE = 8 * 1024 * 1024
+INGEST_CACHE_MAX_BYTES = 2 * 1024 ** 3
+INGEST_CACHE_MAX_AGE_DAYS = 30
+
+def derivation_version(*funcs, settings=None):
+    # 前処理関数（派生列のlambdaを含む）のソースや、列の型・派生列の設定が変わればキャッシュも別物として扱う
+    h = hashlib.sha256(f"format={_FORMAT_VERSION}".encode("utf-8"))
+    for func in funcs:
+        h.update(inspect.getsource(func).encode("utf-8"))
+    if settings is not None:
+        h.update(json.dumps(settings, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+    return h.hexdigest()[:16]
+
+def file_content_hash(path):
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _manifest_path():
+    return os.path.join(INGEST_CACHE_DIR, _MANIFEST_NAME)
+
+def source_fingerprint(path):
+    # パス・サイズ・更新時刻が前回と同じならハッシュ計算を省略する
+    stat = os.stat(path)
+    source = os.path.abspath(path)
+    manifest = read_json(_manifest_path(), {})
+    entry = manifest.get(source)
+    if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+        return entry["hash"]
+
+    digest = file_content_hash(path)
+    manifest[source] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "hash": digest}
+    write_json(_manifest_path(), manifest)
+    if entry and entry["hash"] != digest and all(other["hash"] != entry["hash"] for other in manifest.values()):
+        # 同じパスのCSVが書き換えられたら、他のパスから使われていない旧内容のキャッシュは消す
+        _remove_cached(entry["hash"])
+    return digest
+
+def _remove_cached(digest):
+    if not os.path.isdir(INGEST_CACHE_DIR):
+        return
+    for name in os.listdir(INGEST_CACHE_DIR):
+        if name.startswith(f"{digest}_") and name.endswith(".feather"):
+            os.remove(os.path.join(INGEST_CACHE_DIR, name))
+
+def _prune_stale(version):
+    for name in os.listdir(INGEST_CACHE_DIR):
+        if name.endswith(".feather") and not name.endswith(f"_{version}.feather"):
+            os.remove(os.path.join(INGEST_CACHE_DIR, name))
+
+def evict_ingest_cache(keep=None, max_bytes=INGEST_CACHE_MAX_BYTES, max_age_days=INGEST_CACHE_MAX_AGE_DAYS):
+    # 最後に使ってから max_age_days を過ぎたもの、新しい順の合計が max_bytes を超えた分を消す（keep は残す）
+    if not os.path.isdir(INGEST_CACHE_DIR):
+        return 0
+
+    entries = []
+    for name in os.listdir(INGEST_CACHE_DIR):
+        if not name.endswith(".feather"):
+            continue
+        cache_path = os.path.join(INGEST_CACHE_DIR, name)
+        try:
+            stat = os.stat(cache_path)
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, cache_path))
+
+    entries.sort(reverse=True)
+    cutoff = time.time() - max_age_days * 86400
+    total_bytes = 0
+    removed = 0
+    for mtime, size, cache_path in entries:
+        total_bytes += size
+        if cache_path == keep or (mtime >= cutoff and total_bytes <= max_bytes):
+            continue
+        os.remove(cache_path)
+        removed += 1
+    return removed
+
+def load_with_cache(path, prepare, version):
+    # prepare(path) の結果（派生列込み）をFeatherで保存し、同じ内容のCSVならメモリマップで読み直す
+    try:
+        import pyarrow as pa
+        import pyarrow.feather as feather
+    except ImportError:
+        return prepare(path)
+
+    with span("ファイルの照合"):
+        cache_path = os.path.join(INGEST_CACHE_DIR, f"{source_fingerprint(path)}_{version}.feather")
+    if os.path.exists(cache_path):
+        try:
+            with span("読み込みキャッシュの読み込み"):
+                frame = feather.read_table(cache_path, memory_map=True).to_pandas()
+            os.utime(cache_path)  # 古いものから消すため、使った時刻を更新時刻に残す
+            count("rows", len(frame))
+            return frame
+        except (OSError, pa.ArrowException):
+            os.remove(cache_path)
+
+    frame = prepare(path)
+    os.makedirs(INGEST_CACHE_DIR, exist_ok=True)
+    _prune_stale(version)
+    tmp_path = cache_path + ".tmp"
+    try:
+        with span("読み込みキャッシュの保存"):
+            feather.write_feather(frame, tmp_path, compression="uncompressed")
+            os.replace(tmp_path, cache_path)
+        count("bytes", os.path.getsize(cache_path))
+        evict_ingest_cache(keep=cache_path)
+    except (pa.ArrowException, TypeError, ValueError) as e:
+        # 型が混在する列などで保存できない場合はキャッシュなしで続行する
+        print(f"[csv_analysis] 読み込みキャッシュを保存できませんでした: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return frame
@@ -0,0 +1,106 @@
+import cProfile
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# 処理段階ごとの所要時間と件数の計測。
+#   with collect("読み込み") as record:   # 1回の操作（読み込み・一括予測など）の計測をまとめる
+#       with span("CSV解析"):            # 段階ごとの所要時間（同名の区間は合計する）
+#           ...
+#       count("rows", len(frame))        # 行数・系列数・バイト数などの件数
+# collect の外で呼ばれた span / count は何もしない。ジョブはスレッドごとに計測する
+PROFILE_DIR = "output/logs/profile"
+COUNTER_LABELS = {"rows": "行", "series": "系列", "cached_series": "キャッシュ済み系列", "files": "ファイル", "bytes": "書き込み", "read_bytes": "読み込み", "memo_hits": "メモ命中", "memo_misses": "メモなし"}
+
+_local = threading.local()
+
+def _active():
+    return _local.__dict__.setdefault("records", [])
+
+@contextmanager
+def collect(name, profile=False):
+    record = {"name": name, "spans": {}, "counters": {}, "start": time.perf_counter(), "seconds": None, "profile_path": None}
+    records = _active()
+    records.append(record)
+    profiler = cProfile.Profile() if profile else None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield record
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            path = os.path.join(PROFILE_DIR, f"{datetime.now():%Y-%m-%d_%H%M%S_%f}.prof")
+            profiler.dump_stats(path)
+            record["profile_path"] = path
+        record["seconds"] = time.perf_counter() - record["start"]
+        records[:] = [active for active in records if active is not record]
+
+@contextmanager
+def span(stage):
+    records = _active()
+    if not records:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_span(stage, time.perf_counter() - start)
+
+def add_span(stage, seconds, calls=1):
+    # 入れ子の collect にもそれぞれ加算する（外側の集計にも内側の区間が含まれる）
+    for record in _active():
+        entry = record["spans"].setdefault(stage, {"seconds": 0.0, "calls": 0})
+        entry["seconds"] += seconds
+        entry["calls"] += calls
+
+def count(name, value=1):
+    for record in _active():
+        record["counters"][name] = record["counters"].get(name, 0) + value
+
+def timed(stage=None):
+    # 関数全体を1つの区間として計測するデコレーター（区間名の既定は関数名）
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage or func.__name__):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def call_collected(func, *args):
+    # プロセスプールで実行する関数の包み。(返り値, 計測結果) を返し、親プロセスで merge する
+    with collect(func.__name__) as record:
+        result = func(*args)
+    return result, {"spans": record["spans"], "counters": record["counters"]}
+
+def merge(part):
+    # 別プロセス（並列一括予測のワーカー）で集めた spans / counters を取り込む
+    # 並列に実行した区間は各プロセスの合計になるため、全体の所要時間を超えることがある
+    for stage, entry in part["spans"].items():
+        add_span(stage, entry["seconds"], entry["calls"])
+    for name, value in part["counters"].items():
+        count(name, value)
+
+def _format_counter(name, value):
+    if name.endswith("bytes"):
+        return f"{COUNTER_LABELS.get(name, name)} {value / 1024 ** 2:.1f}MB"
+    return f"{COUNTER_LABELS.get(name, name)} {value:,}"
+
+def summary(record):
+    # collect の終了前に呼んだ場合はその時点までの経過時間を合計とする
+    seconds = record["seconds"] if record["seconds"] is not None else time.perf_counter() - record["start"]
+    lines = [f"📊 {record['name']}: 合計 {seconds:.2f}秒"]
+    for stage, entry in sorted(record["spans"].items(), key=lambda item: -item[1]["seconds"]):
+        calls = f"（{entry['calls']}回）" if entry["calls"] > 1 else ""
+        lines.append(f"  - {stage}: {entry['seconds']:.2f}秒{calls}")
+    if record["counters"]:
+        lines.append("  - 件数: " + "、".join(_format_counter(name, value) for name, value in record["counters"].items()))
+    if record["profile_path"]:
+        lines.append(f"  - cProfile: {record['profile_path']}")
+    return "\n".join(lines)
@@ -0,0 +1,131 @@
+import inspect
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# 種類ごとの同時実行数（超えた分は待ち行列に入る）
+JOB_WORKERS = {"batch": 1, "forecast": 2}
+MAX_PENDING_JOBS = 8
+MAX_FINISHED_JOBS = 50
+JOB_POLL_INTERVAL = 1.0
+
+FINISHED_STATUSES = ("done", "failed", "cancelled")
+STATUS_LABELS = {
+    "queued": "⏳ 待機中",
+    "running": "🏃 実行中",
+    "done": "✅ 完了",
+    "failed": "❌ 失敗",
+    "cancelled": "🛑 キャンセル",
+}
+
+_executors = {}
+_jobs = {}
+_lock = threading.Lock()
+
+def _executor(kind):
+    if kind not in _executors:
+        _executors[kind] = ThreadPoolExecutor(max_workers=JOB_WORKERS.get(kind, 1), thread_name_prefix=f"csv_analysis_{kind}")
+    return _executors[kind]
+
+def _prune_finished():
+    finished = [job_id for job_id, job in _jobs.items() if job["status"] in FINISHED_STATUSES]
+    for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+        del _jobs[job_id]
+
+def submit_job(kind, func, *args, **kwargs):
+    # 受け付けたジョブIDを返す。待ちが多すぎる場合はNone
+    with _lock:
+        active = sum(1 for job in _jobs.values() if job["status"] not in FINISHED_STATUSES)
+        if active >= MAX_PENDING_JOBS:
+            return None
+        _prune_finished()
+        job_id = uuid.uuid4().hex[:8]
+        job = {
+            "id": job_id,
+            "kind": kind,
+            "status": "queued",
+            "log": "",
+            "result": None,
+            "error": None,
+            "submitted": time.time(),
+            "started": None,
+            "finished": None,
+            "cancel": threading.Event(),
+        }
+        _jobs[job_id] = job
+        job["future"] = _executor(kind).submit(_run_job, job, func, args, kwargs)
+    return job_id
+
+def _run_job(job, func, args, kwargs):
+    if job["cancel"].is_set():
+        job["status"] = "cancelled"
+        job["finished"] = time.time()
+        return
+    job["status"] = "running"
+    job["started"] = time.time()
+    try:
+        result = func(*args, **kwargs)
+        if inspect.isgenerator(result):
+            # ジェネレーターはyieldごとに途中経過を残し、その合間でキャンセルを確認する
+            try:
+                for progress in result:
+                    job["log"] = progress
+                    if job["cancel"].is_set():
+                        break
+            finally:
+                result.close()
+            result = job["log"]
+        job["result"] = result
+        job["status"] = "cancelled" if job["cancel"].is_set() else "done"
+    except Exception as e:
+        job["error"] = str(e)
+        job["status"] = "failed"
+        print(f"[csv_analysis] ジョブ {job['id']} が失敗しました: {e}")
+    finally:
+        job["finished"] = time.time()
+
+def cancel_job(job_id):
+    job = _jobs.get(job_id)
+    if job is None:
+        return f"❌ ジョブ {job_id} は見つかりません。"
+    if job["status"] in FINISHED_STATUSES:
+        return f"⚠️ ジョブ {job_id} は既に終了しています（{STATUS_LABELS[job['status']]}）。"
+    job["cancel"].set()
+    if job["future"].cancel():
+        # 未着手ならその場で取り消せる
+        job["status"] = "cancelled"
+        job["finished"] = time.time()
+        return f"🛑 ジョブ {job_id} を取り消しました。"
+    return f"🛑 ジョブ {job_id} にキャンセルを要求しました（実行中の予測が終わり次第停止します）。"
+
+def get_job(job_id):
+    job = _jobs.get(job_id)
+    if job is None:
+        return None
+    return {key: value for key, value in job.items() if key not in ("cancel", "future")}
+
+def format_job(job):
+    header = f"[{job['id']}] {STATUS_LABELS[job['status']]}"
+    if job["started"] is not None:
+        elapsed = (job["finished"] or time.time()) - job["started"]
+        header += f"（{elapsed:.1f}秒）"
+    elif job["status"] == "queued":
+        waiting = sum(1 for other in _jobs.values() if other["kind"] == job["kind"] and other["status"] == "queued" and other["submitted"] < job["submitted"])
+        header += f"（前に{waiting}件）"
+    lines = [header]
+    if job["log"]:
+        lines.append(job["log"])
+    if job["error"]:
+        lines.append(f"❌ エラー: {job['error']}")
+    return "\n".join(lines)
+
+def iter_job(job_id, interval=JOB_POLL_INTERVAL):
+    # 終了するまで一定間隔でジョブの状態を返す（最後の1回は終了後の状態）
+    while True:
+        job = get_job(job_id)
+        if job is None or job["status"] in FINISHED_STATUSES:
+            yield job
+            return
+        yield job
+        time.sleep(interval)
@@ -1,44 +1,329 @@
+import hashlib
 import pandas as pd
 import numpy as np
+import os
+import sys
+import tracemalloc
+import weakref
+from .ingest_cache import load_with_cache, derivation_version
+from .aggregates import build_cube, partial_cube, combine_cube, CUBE_COLUMNS
+from .feature_store import daily_rows, compute_features, update_features, DAILY_COLUMNS
+from .partition_store import ingest_directory, list_parts, ingested_dates, read_part, part_metadata, select_parts, PARTITION_DIR
+from .instrumentation import span, count
 
 df = None
+last_peak_memory = None
+last_peak_traced = False  # last_peak_memory が tracemalloc の値か（Falseなら最大RSSの増加分）
+last_load_cached = False
+TRACE_MEMORY = False  # ストリーミング読み込みのピークメモリを tracemalloc で測る（有効にすると読み込みが大幅に遅くなる）
+_pending_parts = []  # get_df() で初めて読み込むパーティションファイル
+_partition_store = None  # dfの取り込み元パーティション（単一CSV読み込み時はNone）
+_out_of_core = False  # Trueならdfは列構成だけを持つ空のDataFrameで、行は分析のたびにパーティションから必要な分だけ読む
+SCAN_ROWS = 1_000_000  # out-of-core の分析で一度に読む行数の目安（これがピークメモリの上限の目安になる）
+_index = None  # dfのホール・日付・機種ごとの行位置（dfを差し替えるたびに作り直す）
+_cube = None  # dfの集計キャッシュ（初回の get_cube で作り、dfを差し替えると破棄する）
+_feature_table = None  # dfの台ごとの過去成績の特徴量（初回の get_feature_table で作り、dfを差し替えると破棄する）
+_features = {}  # dfに対して require_features で計算した派生列（列名 → 配列、dfを差し替えると破棄する）
+_views = weakref.WeakValueDictionary()  # get_df() が返したビュー（id → DataFrame）
+_version = 0  # dfを差し替えるたびに増やすデータセットの版（結果のメモのキーに使う）
 
-def analyze_csv(file):
-    global df
+def analyze_csv(file, streaming=False):
+    global last_peak_memory, last_load_cached, _pending_parts, _partition_store, _out_of_core
+    if file is None:
+        return "❌ CSVファイルが選択されていません。"
     try:
-        uploaded_df = pd.read_csv(file.name, low_memory=False)
-        if "スコア" in uploaded_df.columns and "曜日" in uploaded_df.columns:
-            df = uploaded_df.copy()
+        last_peak_memory = None
+        last_load_cached = True
+        # 同じ内容のCSVは前処理済みの列キャッシュから読み込む（チャンク読み込みの有無で結果は変わらない）
+        chunksize = CHUNK_SIZE if streaming else None
+        _set_df(load_with_cache(file.name, lambda path: _prepare(path, chunksize), pipeline_version()))
+        # フォルダ取り込みの状態は読み込みに成功してから切り替える（失敗したときは読み込み済みのデータを残す）
+        _pending_parts = []
+        _partition_store = None
+        _out_of_core = False
+        if last_load_cached:
+            memory = "、キャッシュ使用"
+        elif last_peak_memory is not None:
+            label = "ピークメモリ" if last_peak_traced else "最大RSSの増加"
+            memory = f"、{label} {last_peak_memory / 1024 ** 2:.1f}MB"
         else:
-            uploaded_df["日付"] = pd.to_datetime(uploaded_df["ファイル名"].str.extract(r"(\\d{4}-\\d{2}-\\d{2})")[0], errors="coerce")
-            uploaded_df["台番号"] = pd.to_numeric(uploaded_df["台番号"], errors="coerce")
-            uploaded_df["末尾"] = uploaded_df["台番号"] % 10
-            uploaded_df["曜日"] = uploaded_df["日付"].dt.dayofweek
-            uploaded_df["スコア"] = uploaded_df["差枚"] * (uploaded_df["G数"] / uploaded_df["G数"].mean())
-            uploaded_df["高設定"] = (uploaded_df["差枚"] > 1000).astype(int)
-            df = uploaded_df.copy()
-        return f"[csv_analysis] CSV読込成功: {file.name}（{len(df)}件）"
+            memory = ""
+        return f"[csv_analysis] CSV読込成功: {file.name}（{len(df)}件{memory}）"
     except Exception as e:
         return f"分析中にエラー: {str(e)}"
     
+def analyze_directory(source_dir, store_dir=PARTITION_DIR, out_of_core=False):
+    # out_of_core=True なら全体をメモリに載せず、分析はパーティションごとに行う（メモリに収まらない期間のデータ向け）
+    global _pending_parts, _partition_store, _out_of_core
+    try:
+        if not source_dir or not os.path.isdir(source_dir):
+            return f"❌ フォルダが見つかりません: {source_dir}"
+        added, removed = ingest_directory(source_dir, lambda path: preprocess_csv(path, CHUNK_SIZE)[0], store_dir)
+        if out_of_core:
+            _pending_parts = []
+            _partition_store = store_dir
+            _set_df(_schema_frame(store_dir))
+        elif removed or _partition_store != store_dir or _out_of_core:
+            # 既存パーティションの置き換えがあった場合や別のデータから切り替えた場合は全体を読み直す
+            _set_df(None)
+            _pending_parts = list_parts(store_dir)
+        else:
+            _pending_parts = _pending_parts + added
+        _partition_store = store_dir
+        _out_of_core = out_of_core
+        dates = ingested_dates(store_dir)
+        period = f"{dates[0]}〜{dates[-1]}" if dates else "なし"
+        mode = "、メモリに載せずに分析" if out_of_core else ""
+        return f"[csv_analysis] フォルダ取り込み成功: {source_dir}（新規パーティション{len(added)}件、期間 {period}{mode}）"
+    except Exception as e:
+        return f"分析中にエラー: {str(e)}"
+
+def _materialize_partitions(base, parts):
+    # 遅延計算の派生列は取り込んだ時期によって有無が異なるため落としておき、require_features で計算し直す
+    frames = [_drop_lazy_features(frame) for frame in (read_part(part) for part in parts) if len(frame)]
+    if not frames:
+        return base
+    if base is not None:
+        frames.insert(0, _drop_lazy_features(base))
+    return pd.concat(_unify_categories(frames), ignore_index=True)
+
+def _schema_frame(store_dir):
+    # out-of-core 時のdf: 列構成（型）だけを持つ0行のDataFrame
+    parts = list_parts(store_dir)
+    return _drop_lazy_features(read_part(parts[0]).iloc[:0]) if parts else None
+
+def is_out_of_core(frame):
+    return _out_of_core and _is_dataset(frame)
+
+def _concat_parts(frames):
+    return pd.concat(_unify_categories(frames), ignore_index=True) if len(frames) > 1 else frames[0]
+
+def scan(frame, columns=None):
+    # 分析を部分ごとに行うための反復。メモリ上のデータは frame をそのまま1回返し、
+    # out-of-core のデータは columns の列だけを、パーティション単位でおよそ SCAN_ROWS 行ずつまとめて返す
+    if not is_out_of_core(frame):
+        yield frame
+        return
+    metas = part_metadata(_partition_store)
+    batch, rows = [], 0
+    for part in select_parts(_partition_store):
+        batch.append(read_part(part, columns))
+        rows += metas[part]["rows"]
+        if rows >= SCAN_ROWS:
+            yield _concat_parts(batch)
+            batch, rows = [], 0
+    if batch:
+        yield _concat_parts(batch)
+
+def _read_rows(halls=None, dates=None, machines=None, numbers=None, columns=None):
+    # out-of-core のデータから条件に合う行（columns を指定したときはその列と日付）だけを読む。条件に合わないパーティションは開かない
+    dates = None if dates is None else [pd.Timestamp(date).strftime("%Y-%m-%d") for date in dates]
+    columns = None if columns is None else ["日付"] + [col for col in columns if col != "日付"]
+    parts = select_parts(_partition_store, halls, dates, machines)
+    frames = [_drop_lazy_features(read_part(part, columns, halls=halls, machines=machines, numbers=numbers)) for part in parts]
+    frames = [frame for frame in frames if len(frame)]
+    if not frames:
+        return df.iloc[:0]
+    frame = _concat_parts(frames)
+    return frame.sort_values("日付", kind="stable", na_position="last").reset_index(drop=True)
+
+def _partition_dates(hall_name=None):
+    metas = part_metadata(_partition_store).values()
+    return [pd.Timestamp(meta["date"]) for meta in metas if meta["date"] != "unknown" and (hall_name is None or hall_name in meta["halls"])]
+
+def row_count(frame):
+    if is_out_of_core(frame):
+        return sum(meta["rows"] for meta in part_metadata(_partition_store).values())
+    return len(frame)
+
+def _drop_lazy_features(frame):
+    return frame.drop(columns=[name for name in DERIVED_FEATURES if name not in EAGER_FEATURES and name in frame.columns])
+
+def _freeze(frame):
+    # 数値・日付の列を書き込み禁止にして組み直す（配列はコピーしない）
+    # object列は pandas 2 の一部処理が読み取り専用配列を扱えないため対象外
+    columns = {}
+    for col in frame.columns:
+        series = frame[col]
+        if isinstance(series.dtype, np.dtype) and series.dtype.kind in "biufmM":
+            values = series.to_numpy()
+            values.flags.writeable = False
+            columns[col] = values
+        else:
+            columns[col] = series.array
+    return pd.DataFrame(columns, copy=False)
+
+def _set_df(frame):
+    # 型をそろえ、ホール→日付の順に並べてから読み取り専用にする
+    # （ホール・ホールの最新日の行は連続した範囲になる）
+    global df, _index, _cube, _feature_table, _features, _version
+    _version += 1
+    _cube = None
+    _feature_table = None
+    _features = {}
+    _views.clear()
+    if frame is not None:
+        if not pd.api.types.is_datetime64_any_dtype(frame["日付"]):
+            # 渡されたframe（load_and_prepare の結果など）には書き込まない
+            frame = frame.assign(日付=pd.to_datetime(frame["日付"], errors="coerce"))
+        with span("並べ替え"):
+            frame = _freeze(frame.sort_values(["ホール名", "日付"], kind="stable", na_position="last").reset_index(drop=True))
+    df = frame
+    with span("索引の作成"):
+        _index = build_index(frame) if frame is not None else None
+
+def _is_dataset(frame):
+    # 読み込み済みのdfそのもの、または get_df() が返したビューか
+    return frame is not None and df is not None and (frame is df or _views.get(id(frame)) is frame)
+
+def dataset_version(frame):
+    # 読み込み済みのデータ（またはそのビュー）なら現在の版、それ以外のframeはNone
+    return _version if _is_dataset(frame) else None
+
+def build_index(frame):
+    # ホール名・日付で並べ替え済みのframeから、ホール→行範囲・最新日・最新日の行範囲を作る
+    index = {"hall_ranges": {}, "latest_dates": {}, "latest_ranges": {}}
+    if len(frame) == 0:
+        return index
+
+    codes, halls = pd.factorize(frame["ホール名"])
+    boundaries = np.flatnonzero(np.diff(codes)) + 1
+    dates = frame["日付"].to_numpy()
+    for start, stop in zip(np.r_[0, boundaries], np.r_[boundaries, len(frame)]):
+        if codes[start] < 0:
+            continue
+        hall_name = halls[codes[start]]
+        index["hall_ranges"][hall_name] = (int(start), int(stop))
+        # 日付の欠損は各ホールの末尾に並んでいる
+        valid = dates[start:stop]
+        valid = valid[:len(valid) - int(np.isnat(valid).sum())]
+        if len(valid):
+            index["latest_dates"][hall_name] = pd.Timestamp(valid[-1])
+            index["latest_ranges"][hall_name] = (int(start + np.searchsorted(valid, valid[-1], side="left")), int(start + len(valid)))
+    return index
+
+def _index_for(frame):
+    # 読み込み済みのデータを渡されたときだけ索引を使う（部分集合などは従来どおり走査する）
+    return _index if _is_dataset(frame) else None
+
+def get_cube(frame):
+    # 読み込み済みのdfなら集計を使い回し、それ以外のframeはその場で集計する
+    global _cube
+    if not _is_dataset(frame):
+        return build_cube(frame)
+    if _cube is None and _out_of_core:
+        with span("集計キューブの作成"):
+            _cube = combine_cube(partial_cube(part) for part in scan(frame, CUBE_COLUMNS))
+    elif _cube is None:
+        _cube = build_cube(df)
+    return _cube
+
+def get_feature_table(frame):
+    # 読み込み済みのdfなら保存済みの特徴量を差分更新して使い回し、それ以外のframeはその場で計算する
+    global _feature_table
+    if not _is_dataset(frame):
+        return compute_features(daily_rows([frame]))
+    if _feature_table is None:
+        with span("特徴量ストアの更新"):
+            _feature_table = update_features(daily_rows(scan(frame, DAILY_COLUMNS)), dataset_key(frame))[0]
+    return _feature_table
+
+def hall_names(frame):
+    if is_out_of_core(frame):
+        return sorted({hall for meta in part_metadata(_partition_store).values() for hall in meta["halls"]})
+    index = _index_for(frame)
+    if index is None:
+        return frame["ホール名"].dropna().unique().tolist()
+    return list(index["hall_ranges"])
+
+def dataset_key(frame):
+    # 保存する学習済みモデルなどをデータセットごとに分けるキー（ホールの組み合わせ）
+    # 日付が増えても変わらないため、同じホールのデータの追加分は差分更新できる
+    halls = "\n".join(sorted(map(str, hall_names(frame))))
+    return hashlib.sha256(halls.encode("utf-8")).hexdigest()[:16]
+
+def hall_rows(frame, hall_name):
+    if is_out_of_core(frame):
+        return _read_rows(halls=[hall_name])
+    index = _index_for(frame)
+    if index is None:
+        return frame[frame["ホール名"] == hall_name]
+    start, stop = index["hall_ranges"].get(hall_name, (0, 0))
+    return frame.iloc[start:stop]
+
+def number_rows(frame, hall_name, number, columns=None):
+    # 1台（ホール・台番号）の行。columns を指定すると、out-of-core のデータからはその列だけを読む
+    if is_out_of_core(frame):
+        return _read_rows(halls=[hall_name], numbers=[number], columns=columns)
+    rows = hall_rows(frame, hall_name)
+    rows = rows[rows["台番号"] == number]
+    return rows if columns is None else rows[columns]
+
+def latest_date(frame, hall_name=None):
+    if is_out_of_core(frame):
+        return max(_partition_dates(hall_name), default=pd.NaT)
+    index = _index_for(frame)
+    if index is None:
+        target = frame if hall_name is None else frame[frame["ホール名"] == hall_name]
+        return pd.to_datetime(target["日付"]).max()
+    if hall_name is None:
+        return max(index["latest_dates"].values(), default=pd.NaT)
+    return index["latest_dates"].get(hall_name, pd.NaT)
+
+def latest_rows(frame, hall_name):
+    if is_out_of_core(frame):
+        latest = latest_date(frame, hall_name)
+        return df.iloc[:0] if pd.isna(latest) else _read_rows(halls=[hall_name], dates=[latest])
+    index = _index_for(frame)
+    if index is None:
+        hall_df = frame[frame["ホール名"] == hall_name]
+        dates = pd.to_datetime(hall_df["日付"])
+        return hall_df[dates == dates.max()]
+    start, stop = index["latest_ranges"].get(hall_name, (0, 0))
+    return frame.iloc[start:stop]
+
+def latest_positions(frame):
+    # 全ホールを通じた最新日の行位置
+    index = _index_for(frame)
+    if index is None:
+        dates = pd.to_datetime(frame["日付"])
+        return np.flatnonzero((dates == dates.max()).to_numpy())
+    target = latest_date(frame)
+    ranges = [index["latest_ranges"][hall] for hall, date in index["latest_dates"].items() if date == target]
+    if not ranges:
+        return np.array([], dtype=np.intp)
+    return np.concatenate([np.arange(start, stop) for start, stop in ranges])
+
 def get_df():
-    global df
-    return df
+    global df, _pending_parts
+    if _pending_parts:
+        # フォルダ取り込み時は初回アクセスで全体を、以降は追加されたパーティションだけを結合する
+        with span("パーティションの結合"):
+            frame = _materialize_partitions(df, _pending_parts)
+        _set_df(frame)
+        _pending_parts = []
+    if df is None:
+        return None
+    # 呼び出し側で列を追加しても共有のdfには影響しない浅いコピーを返す（数値列は書き込み禁止のまま）
+    view = df.copy(deep=False)
+    _views[id(view)] = view
+    return view
 
 def get_halls():
+    df = get_df()
     if df is not None and "ホール名" in df.columns:
-        return sorted(df["ホール名"].dropna().unique().tolist())
+        return sorted(hall_names(df))
     return []
 
 def get_latest_machines(hall_name):
+    df = get_df()
     if df is None or hall_name is None:
         return []
 
-    latest_date = df[df["ホール名"] == hall_name]["日付"].max()
-    filtered = df[(df["ホール名"] == hall_name) & (df["日付"] == latest_date)]
+    filtered = latest_rows(df, hall_name)
 
     machine_counts = (
-        filtered.groupby("機種名")["台番号"]
+        filtered.groupby("機種名", observed=True)["台番号"]
         .nunique()
         .reset_index(name="台数")
         .sort_values("台数", ascending=False)
@@ -46,59 +331,195 @@ def get_latest_machines(hall_name):
 
     return [f"{row['機種名']}（{row['台数']}台）" for _, row in machine_counts.iterrows()]
 
+NUMERIC_COLUMNS = ['G数', '差枚', 'BB', 'RB', 'ART']
+FRACTION_COLUMNS = ['合成確率', 'BB確率', 'RB確率', 'ART確率']
+CATEGORY_COLUMNS = ['ホール名', '機種名', 'ファイル名']
+CHUNK_SIZE = 200_000
+
+# 桁区切り・プラス記号の除去と全角マイナスの置換を1パスで行う
+_NUMERIC_TRANSLATION = str.maketrans({',': None, '+': None, '−': '-'})
+
 def parse_probability_column(series):
-    def extract_denominator(x):
-        try:
-            if isinstance(x, str) and '/' in x:
-                return float(x.split('/')[1])
-            else:
-                return float(x)
-        except:
-            return np.nan
-    return series.apply(extract_denominator)
+    # "1/xxx" は分母、それ以外はそのまま数値化（変換できないものはNaN）
+    if pd.api.types.is_numeric_dtype(series):
+        return series.astype(float)
+    # 分子と"/"を取り除くだけにして1パスで済ませる（全行が欠損の列でも文字列処理が失敗しない）
+    values = series.astype(str).str.replace(r'^[^/]*/', '', regex=True)
+    return pd.to_numeric(values, errors='coerce').astype(float)
 
 def clean_numeric_columns(df):
-    numeric_cols = ['G数', '差枚', 'BB', 'RB', 'ART']
-    fraction_cols = ['合成確率', 'BB確率', 'RB確率', 'ART確率']
+    for col in NUMERIC_COLUMNS:
+        if col in df.columns and not pd.api.types.is_numeric_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col].astype(str).str.translate(_NUMERIC_TRANSLATION), errors='coerce')
 
-    for col in numeric_cols:
-        if col in df.columns:
-            df[col] = (
-                df[col]
-                .astype(str)
-                .str.replace(',', '', regex=False)
-                .str.replace('+', '', regex=False)
-                .str.replace('−', '-', regex=False)
-            )
-            df[col] = pd.to_numeric(df[col], errors='coerce')
-
-    for col in fraction_cols:
+    for col in FRACTION_COLUMNS:
         if col in df.columns:
             df[col] = parse_probability_column(df[col])
 
     return df
 
-def load_and_prepare(file):
+def _extract_dates(file_names):
+    # ファイル名はカテゴリ型なので、日付の抽出はカテゴリ（ファイル数分）だけで済ませる
+    # 末尾に足したNaTは欠損（コード -1）の行の値（ファイル名がすべて空でカテゴリがない場合も同じ）
+    categories = pd.Series(file_names.cat.categories.astype(str))
+    dates = pd.to_datetime(categories.str.extract(r"(\d{4}-\d{2}-\d{2})")[0], errors="coerce")
+    dates = dates.to_numpy()
+    dates = np.append(dates, np.array(["NaT"], dtype=dates.dtype))
+    return pd.Series(dates[file_names.cat.codes.to_numpy()], index=file_names.index)
+
+def _unify_categories(chunks):
+    for col in CATEGORY_COLUMNS:
+        if col not in chunks[0].columns:
+            continue
+        categories = pd.Index([])
+        for chunk in chunks:
+            categories = categories.union(chunk[col].cat.categories)
+        for chunk in chunks:
+            chunk[col] = chunk[col].cat.set_categories(categories)
+    return chunks
+
+def _max_rss():
+    # プロセスの最大RSS[bytes]。計測の負荷はないが、読み込み前にこれより大きく使っていれば増加分は0になる
     try:
-        uploaded_df = pd.read_csv(file.name, low_memory=False)
+        import resource
+    except ImportError:
+        return None  # Windows
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
 
-        if "スコア" in uploaded_df.columns and "曜日" in uploaded_df.columns:
-            print("[csv_analysis] prepared_for_xgb.csv 構造を検出")
-            df = uploaded_df.copy()
-        else:
-            print("[csv_analysis] raw構造と判定、前処理を実行")
-            # TODO:prophet_dashboardのcombine_and_preprocessの機能を呼び出す形にしたい
-            uploaded_df = clean_numeric_columns(uploaded_df)
-            uploaded_df["日付"] = pd.to_datetime(uploaded_df["ファイル名"].str.extract(r"(\d{4}-\d{2}-\d{2})")[0], errors="coerce")
-            uploaded_df["台番号"] = pd.to_numeric(uploaded_df["台番号"], errors="coerce")
-            uploaded_df["末尾"] = uploaded_df["台番号"] % 10
-            uploaded_df["曜日"] = uploaded_df["日付"].dt.dayofweek
-            uploaded_df["スコア"] = uploaded_df["差枚"] * (uploaded_df["G数"] / uploaded_df["G数"].mean())
-            uploaded_df["高設定"] = (uploaded_df["差枚"] > 1000).astype(int)
-            df = uploaded_df.copy()
-
-        print(f"[csv_analysis] CSV読込成功: {file.name}（{len(df)}件）")
-        return df
+def _peak_memory(trace, start_rss):
+    if trace:
+        return tracemalloc.get_traced_memory()[1]
+    end_rss = _max_rss()
+    return None if start_rss is None or end_rss is None else end_rss - start_rss
+
+# 派生列の定義: 列名 → (計算に使う列, 計算関数)。定義順に計算する
+# EAGER_FEATURES は読み込み時に（並べ替え・索引に使う日付）、それ以外は分析側が require_features で要求した時に計算する
+DERIVED_FEATURES = {
+    "日付": (["ファイル名"], lambda frame: _extract_dates(frame["ファイル名"])),
+    "末尾": (["台番号"], lambda frame: frame["台番号"] % 10),
+    "曜日": (["日付"], lambda frame: frame["日付"].dt.dayofweek),
+    "高設定": (["差枚"], lambda frame: (frame["差枚"] > 1000).astype(int)),
+    # G数の平均は全体で決まるため、連結後（読み込み済みのデータ全体）に対して計算する
+    "スコア": (["差枚", "G数"], lambda frame: frame["差枚"] * (frame["G数"] / frame["G数"].mean())),
+}
+EAGER_FEATURES = ["日付"]
+
+def _parse_schema(columns):
+    # 数値列は文字列のまま読み、clean で1回だけ変換する（型推論と変換の二度手間を避ける）
+    schema = {col: "category" for col in CATEGORY_COLUMNS if col in columns}
+    schema.update({col: str for col in NUMERIC_COLUMNS + FRACTION_COLUMNS + ["台番号"] if col in columns})
+    return schema
+
+def _read_chunks(path, schema, chunksize):
+    if chunksize is None:
+        yield pd.read_csv(path, dtype=schema)
+    else:
+        yield from pd.read_csv(path, dtype=schema, chunksize=chunksize)
+
+def _clean(chunk):
+    chunk = clean_numeric_columns(chunk)
+    if "台番号" in chunk.columns:
+        chunk["台番号"] = pd.to_numeric(chunk["台番号"], errors="coerce")
+    if "日付" in chunk.columns:
+        # 前処理済みCSV（prepared_for_xgb.csv）は日付列を持っている
+        chunk["日付"] = pd.to_datetime(chunk["日付"], errors="coerce")
+    return chunk
+
+def _derive(frame, names):
+    # frame にない派生列だけを、元の列がそろっている場合に計算する
+    for name in names:
+        source, func = DERIVED_FEATURES[name]
+        if name not in frame.columns and all(col in frame.columns for col in source):
+            frame[name] = func(frame)
+    return frame
+
+def preprocess_csv(path, chunksize=None, trace_memory=None):
+    # 読み込みの共通処理: parse（型指定の読み込み）→ clean（数値化）→ derive（日付の抽出）
+    # chunksizeを指定すると固定サイズのチャンクごとに処理して最後に連結する（省メモリ）
+    # 返り値は (DataFrame, 読み込み中のピークメモリ[bytes])
+    # ピークメモリは TRACE_MEMORY が有効なら tracemalloc の値、無効なら最大RSSの増加分（測れない環境ではNone）
+    trace = TRACE_MEMORY if trace_memory is None else trace_memory
+    start_rss = None if trace else _max_rss()
+    tracing = tracemalloc.is_tracing()
+    if trace and not tracing:
+        tracemalloc.start()
+    if trace:
+        tracemalloc.reset_peak()
+    try:
+        columns = pd.read_csv(path, nrows=0).columns
+        count("read_bytes", os.path.getsize(path))
+
+        chunks = []
+        reader = _read_chunks(path, _parse_schema(columns), chunksize)
+        while True:
+            with span("CSV解析"):
+                chunk = next(reader, None)
+            if chunk is None:
+                break
+            count("rows", len(chunk))
+            with span("数値の整形"):
+                chunk = _clean(chunk)
+            with span("派生列の計算"):
+                chunks.append(_derive(chunk, EAGER_FEATURES))
+
+        if not chunks:
+            return pd.DataFrame(columns=columns), _peak_memory(trace, start_rss)
+        if len(chunks) == 1:
+            return chunks[0], _peak_memory(trace, start_rss)
+        with span("チャンクの連結"):
+            frame = pd.concat(_unify_categories(chunks), ignore_index=True)
+        return frame, _peak_memory(trace, start_rss)
+    finally:
+        if trace and not tracing:
+            tracemalloc.stop()
+
+def pipeline_version():
+    # 読み込みキャッシュのキー。前処理の関数・派生列の定義・列の型の設定のどれかが変われば別のキャッシュになる
+    settings = {
+        "numeric": NUMERIC_COLUMNS,
+        "fraction": FRACTION_COLUMNS,
+        "category": CATEGORY_COLUMNS,
+        "eager": EAGER_FEATURES,
+        "features": {name: source for name, (source, _) in DERIVED_FEATURES.items()},
+    }
+    features = [func for _, func in DERIVED_FEATURES.values()]
+    return derivation_version(preprocess_csv, _parse_schema, _read_chunks, _clean, _derive, _unify_categories, clean_numeric_columns, parse_probability_column, _extract_dates, *features, settings=settings)
+
+def _prepare(path, chunksize):
+    global last_peak_memory, last_peak_traced, last_load_cached
+    last_load_cached = False
+    last_peak_traced = TRACE_MEMORY
+    frame, last_peak_memory = preprocess_csv(path, chunksize)
+    return frame
+
+def require_features(frame, names):
+    # 分析に必要な派生列を追加した浅いコピーを返す（frame自体は変更しない）
+    # 読み込み済みのデータでは計算結果を使い回し、返したframeでも索引を使えるようにする
+    missing = [name for name in DERIVED_FEATURES if name in names and name not in frame.columns]
+    if not missing:
+        return frame
+    dataset = _is_dataset(frame)
+    frame = frame.copy(deep=False)
+    with span("派生列の計算"):
+        for name in missing:
+            if dataset and name in _features:
+                frame[name] = _features[name]
+                continue
+            _derive(frame, [name])
+            if dataset and name in frame.columns:
+                values = frame[name].to_numpy()
+                values.flags.writeable = False
+                _features[name] = values
+    if dataset:
+        _views[id(frame)] = frame
+    return frame
+
+def load_and_prepare(file):
+    # 読み込みと派生列の計算（全列）をまとめて行い、DataFrameを返す
+    try:
+        frame, _ = preprocess_csv(file.name)
+        return _derive(frame, DERIVED_FEATURES)
 
     except Exception as e:
         return f"分析中にエラー: {str(e)}"
@@ -0,0 +1,71 @@
+import functools
+import threading
+from collections import OrderedDict
+from .loader import dataset_version
+from .instrumentation import count
+
+# 読み込み済みデータに対するレポート文字列・グラフ画像のメモ（件数上限つきのLRU）。
+# キーは (関数, 引数, データセットの版)。読み込み直しで版が変わったら古い結果はまとめて捨てる
+# 読み込み済みのデータ以外（部分集合など）や、ハッシュできない引数の呼び出しはメモせずに実行する
+# 画像など変更できる結果はコピーを保存・返却し、呼び出し側で描き足したり保存したりしてもメモは変わらない
+MEMO_SIZE = 64
+
+_entries = OrderedDict()
+_stats = {"hits": 0, "misses": 0}
+_version = None
+_lock = threading.Lock()
+
+def _copy(value):
+    # 文字列はそのまま、PIL画像など copy() を持つ結果は複製する
+    copy = getattr(value, "copy", None)
+    return copy() if callable(copy) else value
+
+def memoized(func):
+    @functools.wraps(func)
+    def wrapper(df, *args, **kwargs):
+        global _version
+        version = dataset_version(df)
+        key = (func.__module__, func.__qualname__, args, tuple(sorted(kwargs.items())), version)
+        try:
+            hash(key)
+        except TypeError:
+            version = None
+        if version is None:
+            return func(df, *args, **kwargs)
+
+        with _lock:
+            if version != _version:
+                _entries.clear()
+                _version = version
+            if key in _entries:
+                _entries.move_to_end(key)
+                _stats["hits"] += 1
+                count("memo_hits")
+                return _copy(_entries[key])
+            _stats["misses"] += 1
+        count("memo_misses")
+
+        # 計算中はロックを持たない（同時に同じ呼び出しがあれば両方計算し、後の結果で上書きする）
+        result = func(df, *args, **kwargs)
+        with _lock:
+            if version == _version:
+                _entries[key] = _copy(result)
+                _entries.move_to_end(key)
+                while len(_entries) > MEMO_SIZE:
+                    _entries.popitem(last=False)
+        return result
+    return wrapper
+
+def memo_stats():
+    with _lock:
+        return {**_stats, "entries": len(_entries), "size": MEMO_SIZE}
+
+def memo_summary():
+    stats = memo_stats()
+    calls = stats["hits"] + stats["misses"]
+    rate = f"、命中率 {stats['hits'] / calls:.0%}" if calls else ""
+    return f"📊 結果のメモ: 命中 {stats['hits']}回 / 計算 {stats['misses']}回{rate}（上限 {stats['size']}件）"
+
+def clear():
+    with _lock:
+        _entries.clear()
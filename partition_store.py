@@ -0,0 +1,225 @@
+import glob
+import hashlib
+import json
+import os
+import pandas as pd
+from .instrumentation import span, count
+from .utils import read_json
+
+PARTITION_DIR = "output/partitions"
+_STATE_NAME = "ingested.jsonl"
+_LEGACY_STATE_NAME = "ingested.json"
+_UNKNOWN_DATE = "unknown"
+_states = {}  # store_dir → 読み込み済みの取り込み記録（記録ファイルの更新時刻・サイズが変わると読み直す）
+
+def _has_pyarrow():
+    try:
+        import pyarrow.feather  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def _write_part(frame, path_without_ext):
+    # pyarrowがあればFeather（メモリマップ読み込み可）、なければpickleで保存する
+    with span("パーティションの書き込み"):
+        if _has_pyarrow():
+            import pyarrow.feather as feather
+            path = path_without_ext + ".feather"
+            feather.write_feather(frame.reset_index(drop=True), path + ".tmp", compression="uncompressed")
+        else:
+            path = path_without_ext + ".pkl"
+            frame.to_pickle(path + ".tmp")
+        os.replace(path + ".tmp", path)
+    count("bytes", os.path.getsize(path))
+    return path
+
+def read_part(path, columns=None, halls=None, machines=None, numbers=None):
+    # columns を指定するとその列だけを読む（Featherはメモリマップから必要な列だけを取り出す）
+    # halls / machines / numbers（台番号）を指定するとその行だけに絞る
+    filters = [(col, values) for col, values in (("ホール名", halls), ("機種名", machines), ("台番号", numbers)) if values is not None]
+    if columns is not None:
+        columns = list(columns) + [col for col, _ in filters if col not in columns]
+    with span("パーティションの読み込み"):
+        if path.endswith(".feather"):
+            import pyarrow.feather as feather
+            frame = feather.read_table(path, columns=columns, memory_map=True).to_pandas()
+        else:
+            frame = pd.read_pickle(path)
+            if columns is not None:
+                frame = frame[columns]
+    for col, values in filters:
+        frame = frame[frame[col].isin(values)]
+    return frame
+
+def _state_path(store_dir):
+    return os.path.join(store_dir, _STATE_NAME)
+
+def _state_key(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+def _read_records(path):
+    # 1行1件の記録 {"name": ソースファイル名, "entry": 記録}。同じファイル名は後の行を優先する
+    state, lines = {}, 0
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # 書き込み途中で止まった行
+            state[record["name"]] = record["entry"]
+            lines += 1
+    return state, lines
+
+def _cached_state(store_dir):
+    # 読み込んだ記録はストアごとにメモリに置き、記録ファイルが変わったときだけ読み直す
+    path = _state_path(store_dir)
+    key = _state_key(path)
+    cached = _states.get(store_dir)
+    if cached is not None and cached["key"] == key:
+        return cached
+    if key is None:
+        state, lines = _migrate_legacy_state(store_dir)
+        key = _state_key(path)
+    else:
+        state, lines = _read_records(path)
+    cached = {"key": key, "state": state, "lines": lines, "part_meta": None}
+    _states[store_dir] = cached
+    return cached
+
+def _load_state(store_dir):
+    # 呼び出し側でファイル名の追加・置き換えをしても共有の記録に影響しないよう、辞書をコピーして返す（エントリ自体は書き換えない）
+    return dict(_cached_state(store_dir)["state"])
+
+def _append_state(store_dir, name, entry):
+    # 1ファイル分の記録を追記する（記録全体を書き直さないため、件数が増えても1回の書き込みは一定）
+    path = _state_path(store_dir)
+    prefix = ""
+    if os.path.exists(path) and os.path.getsize(path):
+        with open(path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            prefix = "" if f.read(1) == b"\n" else "\n"  # 途中で止まった行とつながらないようにする
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(prefix + json.dumps({"name": name, "entry": entry}, ensure_ascii=False) + "\n")
+
+def _rewrite_state(store_dir, state):
+    # 上書きされた古い行を除いて記録全体を書き直す
+    path = _state_path(store_dir)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        for name, entry in state.items():
+            f.write(json.dumps({"name": name, "entry": entry}, ensure_ascii=False) + "\n")
+    os.replace(path + ".tmp", path)
+
+def _migrate_legacy_state(store_dir):
+    # 以前の形式（全体を1つのJSONに書き直していた ingested.json）から1度だけ移行する
+    legacy_path = os.path.join(store_dir, _LEGACY_STATE_NAME)
+    state = read_json(legacy_path)
+    if state is None:
+        return {}, 0
+    _rewrite_state(store_dir, state)
+    os.remove(legacy_path)
+    return state, len(state)
+
+def list_parts(store_dir=PARTITION_DIR):
+    state = _load_state(store_dir)
+    return sorted(part for entry in state.values() for part in entry["parts"])
+
+def _part_date(path):
+    # パーティションのフォルダ名（"日付=YYYY-MM-DD"）から日付を取り出す
+    return os.path.basename(os.path.dirname(path)).split("=", 1)[1]
+
+def _describe_part(frame, date):
+    return {
+        "date": date,
+        "halls": sorted(map(str, frame["ホール名"].dropna().unique())),
+        "machines": sorted(map(str, frame["機種名"].dropna().unique())),
+        "rows": len(frame),
+    }
+
+def part_metadata(store_dir=PARTITION_DIR):
+    # パーティションごとの {日付, ホール, 機種, 行数}。記録のない古い取り込み分は1度だけ読み取って補う
+    # 返り値は記録ファイルが変わるまで使い回す（呼び出し側で書き換えない）
+    cached = _cached_state(store_dir)
+    if cached["part_meta"] is not None:
+        return cached["part_meta"]
+    missing = [(name, entry) for name, entry in cached["state"].items() if "part_meta" not in entry]
+    for name, entry in missing:
+        entry = {**entry, "part_meta": {part: _describe_part(read_part(part, ["ホール名", "機種名"]), _part_date(part)) for part in entry["parts"]}}
+        _append_state(store_dir, name, entry)
+    if missing:
+        cached = _cached_state(store_dir)
+    cached["part_meta"] = {part: meta for entry in cached["state"].values() for part, meta in entry["part_meta"].items()}
+    return cached["part_meta"]
+
+def select_parts(store_dir=PARTITION_DIR, halls=None, dates=None, machines=None):
+    # 条件に合う行を含み得るパーティションだけを返す（Noneの条件は絞り込まない。日付は "YYYY-MM-DD"）
+    selected = []
+    for part, meta in sorted(part_metadata(store_dir).items()):
+        if dates is not None and meta["date"] not in dates:
+            continue
+        if halls is not None and not set(meta["halls"]) & set(halls):
+            continue
+        if machines is not None and not set(meta["machines"]) & set(machines):
+            continue
+        selected.append(part)
+    return selected
+
+def ingested_dates(store_dir=PARTITION_DIR):
+    state = _load_state(store_dir)
+    return sorted({date for entry in state.values() for date in entry["dates"]})
+
+def ingest_directory(source_dir, prepare, store_dir=PARTITION_DIR):
+    # 未処理（または更新された）CSVだけを prepare(path) で前処理し、日付ごとのパーティションへ追記する
+    # 返り値は (追加したパーティションファイル, 置き換えで削除したパーティションファイル)
+    os.makedirs(store_dir, exist_ok=True)
+    state = _load_state(store_dir)
+    added = []
+    removed = []
+
+    for path in sorted(glob.glob(os.path.join(source_dir, "*.csv"))):
+        name = os.path.basename(path)
+        stat = os.stat(path)
+        entry = state.get(name)
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            continue
+
+        if entry:
+            # 同名ファイルが更新された場合は、そのファイル由来のパーティションだけを作り直す
+            for part in entry["parts"]:
+                if os.path.exists(part):
+                    os.remove(part)
+            removed.extend(entry["parts"])
+
+        frame = prepare(path)
+        count("files")
+        source_id = hashlib.sha1(name.encode("utf-8")).hexdigest()[:12]
+        dates = frame["日付"].dt.strftime("%Y-%m-%d").fillna(_UNKNOWN_DATE)
+        parts = []
+        part_meta = {}
+        for date, part in frame.groupby(dates, sort=True):
+            part_dir = os.path.join(store_dir, f"日付={date}")
+            os.makedirs(part_dir, exist_ok=True)
+            path = _write_part(part, os.path.join(part_dir, source_id))
+            parts.append(path)
+            # ホール・機種での絞り込み時に読まずに済むよう、含まれる値を記録しておく
+            part_meta[path] = _describe_part(part, date)
+
+        state[name] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "dates": sorted(set(dates)),
+            "rows": len(frame),
+            "parts": parts,
+            "part_meta": part_meta,
+        }
+        # 1ファイルごとに記録を追記し、途中で失敗しても処理済みの分は再実行しない
+        _append_state(store_dir, name, state[name])
+        added.extend(parts)
+
+    # 置き換えで古くなった行が記録の件数を超えたら、取り込みの最後に1度だけ詰め直す
+    if added and _cached_state(store_dir)["lines"] > 2 * len(state):
+        _rewrite_state(store_dir, state)
+    return added, removed
@@ -1,13 +1,15 @@
 import gradio as gr
-from .loader import *
-from .utils import get_japanese_font
-from .analysis.basic_stats import *
-from .analysis.visualization import *
-from .analysis.machine_learning import *
-from .analysis.forecasting import *
+from .loader import analyze_csv, analyze_directory, get_df, get_halls, get_latest_machines
+# 予測モジュールはProphet・matplotlibを使用時に読み込むため、ここでの読み込みは軽い
+from .analysis.forecasting import forecast_machine_with_prophet, iter_batch_forecast_all, batch_forecast_all_parallel
+from .analysis.forecasters import FORECASTERS, DEFAULT_FORECASTER
+from .jobs import submit_job, cancel_job, iter_job, format_job
+from .instrumentation import collect, summary
+from .memo import memo_summary
+import os
 import re
 
-jp_font = get_japanese_font()
+BUSY_MESSAGE = "⚠️ 実行待ちのジョブが多すぎます。しばらくしてから再実行してください。"
 
 def clean_machine_name(name):
     return re.sub(r'（\d+台）$', '', name)
@@ -15,46 +17,104 @@ def clean_machine_name(name):
 def setup():
     print("[csv_analysis] 拡張機能が読み込まれました（Prophet UI対応）")
 
-def forecast_wrapper(hall_name, machine_dropdown_value, days):
+def forecast_wrapper(hall_name, machine_dropdown_value, days, forecaster):
     df = get_df()
     if df is None:
-        return "❌ 先にCSVを読み込んでください。"
-    target = df[df["ホール名"] == hall_name]
+        yield "❌ 先にCSVを読み込んでください。"
+        return
     # 分解して機種名のみ取り出す
     machine_name = clean_machine_name(machine_dropdown_value)
-    return forecast_machine_with_prophet(target, machine_name, days)
+    job_id = submit_job("forecast", forecast_machine_with_prophet, df, machine_name, days, hall_name=hall_name, forecaster=forecaster)
+    if job_id is None:
+        yield BUSY_MESSAGE
+        return
+    # 完了までは画像を更新せずに待つ（待機中もGradioのワーカーは占有しない）
+    for job in iter_job(job_id):
+        if job is None:
+            yield f"❌ ジョブ {job_id} は見つかりません。"
+        elif job["status"] == "done":
+            yield job["result"]
+        elif job["status"] in ("failed", "cancelled"):
+            yield format_job(job)
+        else:
+            yield gr.update()
 
-def batch_wrapper(days):
+def batch_wrapper(days, workers, png, forecaster, profile):
     df = get_df()
     if df is None:
-        return "❌ 先にCSVを読み込んでください。"
-    return batch_forecast_all(df, days)
+        yield "❌ 先にCSVを読み込んでください。", ""
+        return
+    # 1プロセス指定時は従来の逐次実行
+    if int(workers) <= 1:
+        job_id = submit_job("batch", iter_batch_forecast_all, df, days, png=png, forecaster=forecaster, profile=profile)
+    else:
+        job_id = submit_job("batch", batch_forecast_all_parallel, df, days, max_workers=int(workers), png=png, forecaster=forecaster, profile=profile)
+    if job_id is None:
+        yield BUSY_MESSAGE, ""
+        return
+    yield from job_log_stream(job_id)
 
-def load_and_update(file):
-    msg = analyze_csv(file)
-    return msg, gr.update(choices=get_halls())
+def job_log_stream(job_id):
+    job_id = job_id.strip()
+    for job in iter_job(job_id):
+        if job is None:
+            yield f"❌ ジョブ {job_id} は見つかりません。", job_id
+            return
+        yield format_job(job), job_id
+
+def cancel_wrapper(job_id):
+    return cancel_job(job_id.strip())
+
+def load_and_update(file, streaming, profile):
+    # 読み込みから索引作成までの段階ごとの所要時間と、これまでの結果のメモの利用状況を結果に添える
+    with collect("読み込み", profile) as record:
+        msg = analyze_csv(file, streaming)
+        halls = get_halls()
+    return f"{msg}\n{summary(record)}\n{memo_summary()}", gr.update(choices=halls)
+
+def load_dir_and_update(source_dir, out_of_core, profile):
+    with collect("フォルダ取り込み", profile) as record:
+        msg = analyze_directory(source_dir.strip(), out_of_core=out_of_core)
+        halls = get_halls()
+    return f"{msg}\n{summary(record)}\n{memo_summary()}", gr.update(choices=halls)
 
 def ui():
     with gr.Blocks() as block:
         with gr.Row():
             file_input = gr.File(label="CSVファイルをアップロード")
+            stream_input = gr.Checkbox(label="チャンク読み込み（省メモリ）", value=False)
             load_button = gr.Button("読み込み")
-        load_output = gr.Textbox(label="読み込み結果")
+        with gr.Row():
+            dir_input = gr.Textbox(label="CSVフォルダ（新しい日付のファイルだけを追加取り込み）")
+            out_of_core_input = gr.Checkbox(label="メモリに載せずに分析（大量の期間向け、XGBoost予測は不可）", value=False)
+            dir_button = gr.Button("フォルダ取り込み")
+        profile_input = gr.Checkbox(label="cProfile の結果を保存する（output/logs/profile、読み込み・一括予測）", value=False)
+        load_output = gr.Textbox(label="読み込み結果", lines=4)
 
         hall_dropdown = gr.Dropdown(label="ホール名", choices=[], interactive=True)
         machine_dropdown = gr.Dropdown(label="機種名（最新のみ）", choices=[], interactive=True)
         days_input = gr.Slider(label="予測日数", minimum=3, maximum=14, step=1, value=7)
+        forecaster_input = gr.Dropdown(label="予測モデル（weekday_trend: 曜日効果+トレンドの高速モデル）", choices=list(FORECASTERS), value=DEFAULT_FORECASTER)
+        png_input = gr.Checkbox(label="一括予測でグラフ画像（PNG）も保存する（オフでCSVのみ）", value=True)
+        workers_input = gr.Slider(label="一括予測の並列プロセス数", minimum=1, maximum=os.cpu_count() or 1, step=1, value=os.cpu_count() or 1)
 
         with gr.Row():
-            predict_button = gr.Button("Prophetによる差枚予測")
+            predict_button = gr.Button("差枚予測（グラフ表示）")
             batch_button = gr.Button("全ホール一括予測（保存）")
 
         predict_image = gr.Image(label="予測グラフ")
+        with gr.Row():
+            job_id_input = gr.Textbox(label="ジョブID（画面を閉じても後から状態を確認できます）")
+            status_button = gr.Button("状態確認")
+            cancel_button = gr.Button("キャンセル")
         batch_output = gr.Textbox(label="一括実行ログ", lines=15)
 
-        load_button.click(load_and_update, inputs=file_input, outputs=[load_output, hall_dropdown])
+        load_button.click(load_and_update, inputs=[file_input, stream_input, profile_input], outputs=[load_output, hall_dropdown])
+        dir_button.click(load_dir_and_update, inputs=[dir_input, out_of_core_input, profile_input], outputs=[load_output, hall_dropdown])
         hall_dropdown.change(lambda h: gr.update(choices=get_latest_machines(h)), inputs=hall_dropdown, outputs=machine_dropdown)
-        predict_button.click(forecast_wrapper, inputs=[hall_dropdown, machine_dropdown, days_input], outputs=predict_image)
-        batch_button.click(batch_wrapper, inputs=days_input, outputs=batch_output)
+        predict_button.click(forecast_wrapper, inputs=[hall_dropdown, machine_dropdown, days_input, forecaster_input], outputs=predict_image)
+        batch_button.click(batch_wrapper, inputs=[days_input, workers_input, png_input, forecaster_input, profile_input], outputs=[batch_output, job_id_input])
+        status_button.click(job_log_stream, inputs=job_id_input, outputs=[batch_output, job_id_input])
+        cancel_button.click(cancel_wrapper, inputs=job_id_input, outputs=load_output)
 
     return block
@@ -0,0 +1,11 @@
+import importlib.machinery
+import importlib.util
+import os
+import sys
+
+# リポジトリ直下を csv_analysis パッケージとして読み込む（拡張機能として置かれたときと同じ相対importになる）
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if "csv_analysis" not in sys.modules:
+    package = importlib.util.module_from_spec(importlib.machinery.ModuleSpec("csv_analysis", None, is_package=True))
+    package.__path__ = [ROOT]
+    sys.modules["csv_analysis"] = package
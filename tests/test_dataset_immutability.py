@@ -0,0 +1,76 @@
+from types import SimpleNamespace
+import numpy as np
+import pandas as pd
+import pytest
+from csv_analysis import loader
+from csv_analysis.analysis import basic_stats, forecasters, forecasting, machine_learning, visualization
+from csv_analysis.benchmarks.synthetic import write_raw_csv
+
+REPORTS = [
+    basic_stats.analyze_by_weekday,
+    basic_stats.analyze_machine_trend,
+    basic_stats.perform_analysis,
+    basic_stats.analyze_high_win_freq,
+    basic_stats.analyze_tail_numbers,
+    basic_stats.analyze_consecutive_hits,
+    machine_learning.compute_high_setting_score,
+    machine_learning.predict_high_setting_xgb,
+    visualization.plot_machine_trend_graph,
+    visualization.plot_score_trend,
+    visualization.plot_hall_score_dist,
+]
+
+def _stub_fit_many(series, days):
+    # 直近の平均をそのまま予測とする（Prophetなしで forecast_machine_with_prophet を通すため）
+    results = []
+    for grouped in series:
+        ds = pd.to_datetime(grouped["ds"])
+        future = pd.date_range(ds.max() + pd.Timedelta(days=1), periods=days)
+        level = float(grouped["y"].mean())
+        forecast = pd.DataFrame({"ds": ds.tolist() + future.tolist()})
+        forecast["yhat"] = level
+        forecast["yhat_lower"] = level - 1
+        forecast["yhat_upper"] = level + 1
+        results.append((forecast, "{}"))
+    return results
+
+@pytest.fixture
+def dataset(tmp_path, monkeypatch):
+    # キャッシュ・予測結果（output/ 以下の相対パス）は一時フォルダに書き出す
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setitem(forecasters.FORECASTERS, "stub", {"fit_many": _stub_fit_many, "params": lambda: {"forecaster": "stub"}, "vectorized": False})
+
+    path = tmp_path / "raw.csv"
+    write_raw_csv(path, 2, 30, 40)
+    prepared = loader.load_and_prepare(SimpleNamespace(name=str(path)))
+    # 前処理済みCSVを読み直したときと同じく日付は文字列で渡す（_set_df が型をそろえる）
+    prepared = prepared.assign(日付=prepared["日付"].dt.strftime("%Y-%m-%d"))
+    prepared_hash = pd.util.hash_pandas_object(prepared)
+    loader._set_df(prepared)
+    # 読み込み時に渡したframeも書き換えない
+    pd.testing.assert_series_equal(pd.util.hash_pandas_object(prepared), prepared_hash)
+    yield loader.get_df()
+    loader._set_df(None)
+
+def _frozen_arrays(frame):
+    return {col: frame[col].to_numpy() for col in frame.columns if isinstance(frame[col].dtype, np.dtype) and frame[col].dtype.kind in "biufmM"}
+
+def test_reports_do_not_mutate_dataset(dataset):
+    before = pd.util.hash_pandas_object(dataset)
+    frozen = _frozen_arrays(loader.df)
+    assert "日付" in frozen and "差枚" in frozen
+
+    for report in REPORTS:
+        report(loader.get_df())
+    hall_name = loader.get_halls()[0]
+    machine_name = loader.latest_rows(dataset, hall_name)["機種名"].iloc[0]
+    image = forecasting.forecast_machine_with_prophet(loader.get_df(), machine_name, 3, hall_name=hall_name, forecaster="stub")
+    assert not isinstance(image, str), image
+
+    pd.testing.assert_series_equal(pd.util.hash_pandas_object(loader.get_df()), before)
+    for col, values in _frozen_arrays(loader.df).items():
+        assert not values.flags.writeable, col
+
+def test_view_columns_are_read_only(dataset):
+    with pytest.raises(ValueError):
+        dataset["差枚"].to_numpy()[0] = 0
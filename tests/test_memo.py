@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+from PIL import Image, ImageDraw
+from csv_analysis import loader, memo
+
+CALLS = []
+
+@memo.memoized
+def _report(df, label):
+    CALLS.append(label)
+    return f"{label}: {len(df)}行"
+
+@memo.memoized
+def _image(df):
+    CALLS.append("image")
+    return Image.new("RGB", (8, 8), "white")
+
+def _frame(days):
+    dates = pd.date_range("2024-01-01", periods=days)
+    return pd.DataFrame({"ホール名": "A", "機種名": "m", "台番号": 1, "日付": dates, "差枚": np.arange(days, dtype=float), "G数": 1000.0})
+
+def setup_function():
+    CALLS.clear()
+    memo.clear()
+
+def teardown_function():
+    loader._set_df(None)
+
+def test_hits_until_reload():
+    loader._set_df(_frame(3))
+    assert _report(loader.get_df(), "x") == _report(loader.get_df(), "x") == "x: 3行"
+    assert CALLS == ["x"]
+    # 引数が違えば別の結果
+    _report(loader.get_df(), "y")
+    assert CALLS == ["x", "y"]
+
+    loader._set_df(_frame(5))
+    assert _report(loader.get_df(), "x") == "x: 5行"
+    assert CALLS == ["x", "y", "x"]
+
+def test_other_frames_are_not_memoized():
+    loader._set_df(_frame(3))
+    subset = loader.get_df().head(2)
+    _report(subset, "x")
+    _report(subset, "x")
+    assert CALLS == ["x", "x"]
+
+def test_images_are_copied():
+    loader._set_df(_frame(3))
+    first = _image(loader.get_df())
+    ImageDraw.Draw(first).rectangle((0, 0, 7, 7), fill="black")
+    second = _image(loader.get_df())
+    assert CALLS == ["image"]
+    assert second.getpixel((0, 0)) == (255, 255, 255)
+    assert second is not _image(loader.get_df())
@@ -1,9 +1,60 @@
-from matplotlib.font_manager import FontProperties
+import functools
+import json
+import os
 import re
+import sys
+import pandas as pd
 
+# 日本語フォントの候補（見つかった最初のファイルを使う）
+JAPANESE_FONT_FILES = {
+    "win32": ["C:/Windows/Fonts/meiryo.ttc", "C:/Windows/Fonts/YuGothM.ttc", "C:/Windows/Fonts/msgothic.ttc"],
+    "darwin": ["/System/Library/Fonts/ヒラギノ角ゴシック W3.ttc", "/System/Library/Fonts/Hiragino Sans GB.ttc", "/Library/Fonts/Osaka.ttf"],
+}
+JAPANESE_FONT_FAMILIES = ["Meiryo", "Yu Gothic", "Hiragino Sans", "Noto Sans CJK JP", "Noto Sans JP", "IPAexGothic", "IPAGothic", "TakaoGothic", "VL Gothic"]
+
+@functools.lru_cache(maxsize=None)
 def get_japanese_font():
-    return FontProperties(fname="C:/Windows/Fonts/meiryo.ttc")
+    # 初回のグラフ描画時に一度だけ探す（matplotlibもここで初めて読み込む）
+    from matplotlib.font_manager import FontProperties, findfont
+    platform = "win32" if sys.platform.startswith("win") else sys.platform
+    for path in JAPANESE_FONT_FILES.get(platform, []):
+        if os.path.exists(path):
+            return FontProperties(fname=path)
+    for family in JAPANESE_FONT_FAMILIES:
+        try:
+            return FontProperties(fname=findfont(FontProperties(family=family), fallback_to_default=False))
+        except ValueError:
+            continue
+    print("[csv_analysis] ⚠️ 日本語フォントが見つかりません。グラフの日本語が表示されない可能性があります")
+    return FontProperties()
+
+def read_json(path, default=None):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return default
+
+def write_json(path, data):
+    # 一時ファイルに書いてから置き換える（書き込み途中で止まっても壊れたファイルを残さない）
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+
+def date_digests(row_hash, dates):
+    # 日付ごとの行ハッシュの合計（row_hash と dates は同じ行の並び）。保存済みの計算結果との比較に使う
+    digests = row_hash.groupby(pd.DatetimeIndex(dates).strftime("%Y-%m-%d").to_numpy()).sum()
+    return {date: str(digest) for date, digest in digests.items()}
+
+def appended_dates(previous, digests):
+    # 前回（previous）から日付が後ろに増えただけなら追加された日付の一覧、それ以外（変わった日がある等）はNone
+    new_dates = sorted(set(digests) - set(previous))
+    unchanged = all(digests.get(date) == digest for date, digest in previous.items())
+    if previous and unchanged and new_dates and new_dates[0] > max(previous):
+        return new_dates
+    return None
 
 def sanitize_filename(name):
     # 禁止文字を_に置換（Windowsファイル名対策）
-    return re.sub(r'[\\\\/:*?"<>|]', '_', name).strip().rstrip('.')
\ No newline at end of file
+    return re.sub(r'[\\\\/:*?"<>|]', '_', name).strip().rstrip('.')